@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+#
+#  File:       bnc_cooper.py
+#  Author:     Juan Pedro Bolívar Puente <raskolnikov@es.gnu.org>
+#
+
+#
+#  Copyright (c) 2012, 2015 Juan Pedro Bolivar Puente <raskolnikov@gnu.org>
+#
+#  Permission is hereby granted, free of charge, to any person
+#  obtaining a copy of this software and associated documentation
+#  files (the "Software"), to deal in the Software without
+#  restriction, including without limitation the rights to use, copy,
+#  modify, merge, publish, distribute, sublicense, and/or sell copies
+#  of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be
+#  included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+#  NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+#  BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+#  ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+#  CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+
+"""
+Benchmarks for cooper.
+
+Every benchmark compares some cooperative code against the same code
+written by hand with super, and its result is the ratio between their
+times, which depends much less on the machine than the times
+themselves.
+"""
+
+import cPickle
+import cooper
+import copy
+import gc
+import timeit
+
+
+benchmarks = []
+
+def benchmark(name, number=1000):
+    """
+    Registers a function that returns the '(manual, coop)' pair of
+    callables that benchmark 'name' compares, each of them called
+    'number' times per measure.
+    """
+    def decorator(setup):
+        benchmarks.append((name, setup, number))
+        return setup
+    return decorator
+
+
+# Hand written methods.  'cell' holds the class, for super.
+_manual_sources = {
+    'pre': '''
+def method(self, x, **kw):
+    super(cell[0], self).method(x, **kw)
+    self.x = x
+''',
+    'post': '''
+def method(self, x, **kw):
+    self.x = x
+    super(cell[0], self).method(x, **kw)
+''',
+    'inner': '''
+def method(self, x, **kw):
+    super(cell[0], self).method(x, **kw)
+    self.x = x
+''',
+    'params': '''
+def method(self, x, **kw):
+    kw['fixed'] = %(level)d
+    super(cell[0], self).method(x, **kw)
+    self.x = x
+''',
+    'extend': '''
+def method(self, x, **kw):
+    return super(cell[0], self).method(x, **kw) + [x]
+''',
+    'cached': '''
+def method(self, x, **kw):
+    super(cell[0], self).method(x, **kw)
+    self.x = x
+''',
+    'short': '''
+def method(self, x, **kw):
+    if x:
+        return x
+    return super(cell[0], self).method(x, **kw)
+''',
+    'stream': '''
+def method(self, x, **kw):
+    for item in super(cell[0], self).method(x, **kw):
+        yield item
+    for item in xrange(x):
+        yield item
+''',
+    'root': '''
+def method(self, x, **kw):
+    self.x = x
+''',
+    'extend_root': '''
+def method(self, x, **kw):
+    return [x]
+''',
+    'stream_root': '''
+def method(self, x, **kw):
+    return xrange(x)
+''',
+    'init': '''
+def __init__(self, k%(level)d=None, **kw):
+    super(cell[0], self).__init__(**kw)
+    self.x = k%(level)d
+''',
+}
+
+_coop_sources = {
+    'pre': '''
+@cooper.cooperate
+def method(self, x):
+    self.x = x
+''',
+    'post': '''
+@cooper.post_cooperate
+def method(self, x):
+    self.x = x
+''',
+    'inner': '''
+@cooper.inner_cooperate
+def method(self, next_method, x):
+    next_method()
+    self.x = x
+''',
+    'params': '''
+@cooper.cooperate_with_params(fixed=%(level)d)
+def method(self, x):
+    self.x = x
+''',
+    'extend': '''
+@cooper.extend_cooperate
+def method(self, x):
+    return [x]
+''',
+    'cached': '''
+@cooper.cached_cooperate()
+def method(self, x):
+    self.x = x
+''',
+    'short': '''
+@cooper.short_cooperate
+def method(self, x):
+    if x:
+        return x
+''',
+    'stream': '''
+@cooper.stream_cooperate
+def method(self, x):
+    for item in xrange(x):
+        yield item
+''',
+    'root': '''
+@cooper.cooperative
+def method(self, x, **kw):
+    self.x = x
+''',
+    'extend_root': '''
+@cooper.cooperative
+def method(self, x, **kw):
+    return [x]
+''',
+    'stream_root': '''
+@cooper.cooperative
+def method(self, x, **kw):
+    return xrange(x)
+''',
+    'init': '''
+@cooper.cooperate
+def __init__(self, k%(level)d=None):
+    self.x = k%(level)d
+''',
+}
+
+def make_method(source, level, cell=None):
+    namespace = { 'cooper': cooper, 'cell': cell }
+    exec source % { 'level': level } in namespace
+    return [value for key, value in namespace.iteritems()
+            if key in ('method', '__init__')][0]
+
+def linear(depth):
+    """ Shape of a hierarchy with 'depth' classes over the root. """
+    return [[]] + [[i] for i in xrange(depth)]
+
+def wide(width):
+    """
+    Shape of a hierarchy with 'width' classes over the root and a
+    class inheriting from all of them.
+    """
+    return [[]] + [[0]] * width + [range(1, width + 1)]
+
+def make_hierarchy(shape, kind, coop, method='method'):
+    """
+    Creates the classes for the 'shape', which lists the indexes of
+    the bases of every class, with methods of the given 'kind'.
+    Returns the last class.
+    """
+    classes = []
+    for level, bases in enumerate(shape):
+        if method == '__init__':
+            source_kind = 'init'
+        else:
+            source_kind = kind if bases else \
+                          kind + '_root' if kind in ('extend', 'stream') \
+                          else 'root'
+        cell = [None]
+        if coop:
+            fn = make_method(_coop_sources[source_kind], level)
+            cls = cooper.cooperative_class(type(
+                'Coop%d' % level,
+                tuple(classes[b] for b in bases) or (object,),
+                { method: fn }))
+        else:
+            fn = make_method(_manual_sources[source_kind], level, cell)
+            cls = type('Manual%d' % level,
+                       tuple(classes[b] for b in bases) or (object,),
+                       { method: fn })
+        cell[0] = cls
+        classes.append(cls)
+    return classes[-1]
+
+def call_pair(shape, kind, keywords=0):
+    kws = dict(('kw%d' % i, i) for i in xrange(keywords))
+    manual = make_hierarchy(shape, kind, False)()
+    coop   = make_hierarchy(shape, kind, True)()
+    return (lambda: manual.method(1, **kws),
+            lambda: coop.method(1, **kws))
+
+
+for _kind in ('pre', 'post', 'inner', 'params'):
+    for _depth in (1, 4, 8):
+        benchmark('call_%s_depth%d' % (_kind, _depth))(
+            lambda kind=_kind, depth=_depth: call_pair(linear(depth), kind))
+
+# The manual version copies the list at every level
+for _depth in (4, 16):
+    benchmark('call_extend_depth%d' % _depth)(
+        lambda depth=_depth: call_pair(linear(depth), 'extend'))
+
+# The manual version runs the whole chain every time
+benchmark('call_cached_depth8')(lambda: call_pair(linear(8), 'cached'))
+
+# Handled by the most derived override
+for _depth in (4, 16):
+    benchmark('call_short_depth%d' % _depth)(
+        lambda depth=_depth: call_pair(linear(depth), 'short'))
+
+# Nested generators pass every item through all the levels
+for _depth in (4, 16):
+    @benchmark('stream_depth%d' % _depth, number=100)
+    def stream_pair(depth=_depth):
+        manual = make_hierarchy(linear(depth), 'stream', False)()
+        coop   = make_hierarchy(linear(depth), 'stream', True)()
+        return (lambda: sum(manual.method(20)),
+                lambda: sum(coop.method(20)))
+
+for _width in (2, 8):
+    benchmark('call_pre_width%d' % _width)(
+        lambda width=_width: call_pair(wide(width), 'pre'))
+
+for _keywords in (0, 4, 16):
+    benchmark('call_pre_keywords%d' % _keywords)(
+        lambda keywords=_keywords: call_pair(linear(4), 'pre', keywords))
+
+# Both have four overrides, but one goes through a diamond
+benchmark('call_pre_linear_mro')(lambda: call_pair(linear(3), 'pre'))
+benchmark('call_pre_diamond_mro')(lambda: call_pair(wide(2), 'pre'))
+
+@benchmark('init_depth4')
+def init_pair():
+    kws = dict(('k%d' % i, i) for i in xrange(5))
+    manual = make_hierarchy(linear(4), None, False, '__init__')
+    coop   = make_hierarchy(linear(4), None, True, '__init__')
+    return lambda: manual(**kws), lambda: coop(**kws)
+
+@benchmark('class_creation_depth4', number=50)
+def class_creation_pair():
+    return (lambda: make_hierarchy(linear(4), 'pre', False),
+            lambda: make_hierarchy(linear(4), 'pre', True))
+
+@benchmark('compose_mixins4', number=50)
+def compose_pair():
+    root   = make_hierarchy(linear(0), 'pre', True)
+    mixins = tuple(cooper.cooperative_class(type(
+        'Mixin%d' % i, (root,), { 'method': make_method(
+            _coop_sources['pre'], i) })) for i in xrange(4))
+    return (lambda: cooper.cooperative_class(type('Mixed', mixins, {})),
+            lambda: cooper.compose(*mixins))
+
+def call_all_pair(keywords):
+    # The hierarchy of the README, with another kind of entity.  Unlike
+    # the others, this compares 'call_all' with calling the cooperative
+    # method of every object in a loop.
+    @cooper.cooperative_class
+    class Entity(object):
+        @cooper.cooperative
+        def update(self, timer, **kw):
+            self.timer = timer
+    @cooper.cooperative_class
+    class Player(Entity):
+        @cooper.cooperate
+        def update(self, timer, speed=1):
+            self.score = timer * speed
+    @cooper.cooperative_class
+    class Moving(Entity):
+        @cooper.cooperate
+        def update(self, timer, dx=0):
+            self.x = timer + dx
+    kws = dict([('speed', 2), ('dx', 1)][:keywords])
+    objects = [Player() if i % 2 else Moving() for i in xrange(1000)]
+    def loop():
+        for obj in objects:
+            obj.update(0, **kws)
+    return loop, lambda: cooper.call_all(objects, 'update', 0, **kws)
+
+for _keywords in (0, 2):
+    benchmark('call_all_keywords%d' % _keywords, number=20)(
+        lambda keywords=_keywords: call_all_pair(keywords))
+
+def create_many_pair(columns):
+    # Like 'call_all', compared with calling the class in a loop
+    cls  = make_hierarchy(linear(2), None, True, '__init__')
+    rows = [dict(('k%d' % level, i) for level in xrange(3))
+            for i in xrange(1000)]
+    if columns:
+        cols = dict((key, [row[key] for row in rows]) for key in rows[0])
+        coop = lambda: list(cooper.create_many(cls, columns=cols))
+    else:
+        coop = lambda: list(cooper.create_many(cls, rows))
+    return lambda: [cls(**row) for row in rows], coop
+
+benchmark('create_many_rows', number=10)(lambda: create_many_pair(False))
+benchmark('create_many_columns', number=10)(lambda: create_many_pair(True))
+
+def make_state_object(depth, coop):
+    """
+    Returns an object of a linear hierarchy of 'depth' classes over
+    the root, each of them with two fields.
+    """
+    base = object
+    for level in xrange(depth + 1):
+        fields = ('a%d' % level, 'b%d' % level)
+        if coop:
+            base = cooper.cooperative_class(type(
+                'State%d' % level, (base,), {
+                    '__cooperative_state__': fields,
+                    '__module__': __name__ }))
+        else:
+            base = type('Plain%d' % level, (base,), {
+                '__module__': __name__ })
+        globals()[base.__name__] = base
+    obj = base()
+    for level in xrange(depth + 1):
+        setattr(obj, 'a%d' % level, level)
+        setattr(obj, 'b%d' % level, str(level))
+    return obj
+
+@benchmark('deepcopy_state_depth4')
+def deepcopy_pair():
+    manual = make_state_object(4, False)
+    coop   = make_state_object(4, True)
+    return lambda: copy.deepcopy(manual), lambda: copy.deepcopy(coop)
+
+@benchmark('pickle_state_depth4')
+def pickle_pair():
+    manual = make_state_object(4, False)
+    coop   = make_state_object(4, True)
+    return (lambda: cPickle.loads(cPickle.dumps(manual, 2)),
+            lambda: cPickle.loads(cPickle.dumps(coop, 2)))
+
+
+def measure(setup, number=1000, repeat=30):
+    """
+    Runs the benchmark from 'setup' and returns a dictionary with the
+    best 'manual' and 'coop' times per call, their 'ratio', the number
+    of objects that the cooperative version leaves alive per thousand
+    calls, as 'retained', and those it allocates per call, as
+    'allocated'.
+    """
+    manual, coop = setup()
+    manual()
+    coop()
+    # Alternate them, so that changes in the load of the machine
+    # affect both the same
+    manual_timer = timeit.Timer(manual)
+    coop_timer   = timeit.Timer(coop)
+    t_manual = t_coop = float('inf')
+    for _ in xrange(repeat):
+        t_manual = min(t_manual, manual_timer.timeit(number))
+        t_coop   = min(t_coop, coop_timer.timeit(number))
+    return { 'manual':   t_manual / number,
+             'coop':     t_coop / number,
+             'ratio':    t_coop / t_manual,
+             'retained': retained_objects(coop),
+             'allocated': allocated_objects(coop) }
+
+def retained_objects(fn, number=1000):
+    """
+    Returns how many more objects tracked by the garbage collector
+    there are after calling 'fn' 'number' times.  Python 2 can not
+    count the temporary allocations of a call, but this catches the
+    ones that are never freed.
+    """
+    gc.collect()
+    before = len(gc.get_objects())
+    for _ in xrange(number):
+        fn()
+    gc.collect()
+    return max(0, len(gc.get_objects()) - before)
+
+def allocated_objects(fn, number=100):
+    """
+    Returns how many objects tracked by the garbage collector a call
+    to 'fn' allocates, less those it frees, from the growth of the
+    count of the youngest generation while the collector is off.  The
+    results are kept, so that the objects they hold are counted.
+    """
+    results = []
+    enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        # The count stops at zero, which would miss frees otherwise
+        padding = [[] for _ in xrange(1000)]
+        before  = gc.get_count()[0]
+        for _ in xrange(number):
+            results.append(fn())
+        after   = gc.get_count()[0]
+    finally:
+        if enabled:
+            gc.enable()
+    del padding
+    return float(after - before) / number
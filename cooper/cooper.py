@@ -33,13 +33,84 @@
 Cooperative methods helper library.
 """
 
+import atexit
+import copy
+import copy_reg
+import hashlib
 import inspect
-from functools import wraps
+import json
+import linecache
+import marshal
+import math
+import operator
+import os
+import re
+import sys
+import thread
+import threading
+import types
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from copy import deepcopy
+from functools import partial, wraps
+from itertools import chain, count, izip
+from keyword import iskeyword
+from timeit import default_timer
 
 class CooperativeError(TypeError): pass
 
+class MethodSignature(object):
+    """
+    The parameters of a method, as the library cares about them.
+    The 'positional' parameters are the ones without default value,
+    not counting 'self', and the 'keywords' the ones with a default
+    value, whose values are in 'defaults'.  'varargs' and 'varkw' are
+    the names of the variadic parameters, or None.  Python 2 has no
+    keyword-only parameters, so 'keyword_only' is always empty.
+    """
+
+    __slots__ = ('positional', 'keywords', 'keyword_only', 'defaults',
+                 'varargs', 'varkw')
+
+    def __init__(self, method):
+        args, varargs, varkw, defaults = inspect.getargspec(method)
+        split = len(args) - len(defaults or ())
+        self.positional   = tuple(args[1:split])
+        self.keywords     = tuple(args[split:])
+        self.keyword_only = ()
+        self.defaults     = tuple(defaults or ())
+        self.varargs      = varargs
+        self.varkw        = varkw
+
+    @property
+    def names(self):
+        """ All the parameters that can be passed by name. """
+        return self.positional + self.keywords + self.keyword_only
+
+    def __repr__(self):
+        return '<MethodSignature (%s)>' % ', '.join(
+            list(self.positional) +
+            ['%s=%r' % kv for kv in zip(self.keywords, self.defaults)] +
+            (['*' + self.varargs] if self.varargs else []) +
+            (['**' + self.varkw] if self.varkw else []))
+
+_signatures = weakref.WeakKeyDictionary()
+
+def method_signature(method):
+    """
+    Returns the MethodSignature of 'method'.  It is computed only once
+    per function.
+    """
+    try:
+        return _signatures[method]
+    except KeyError:
+        sig = _signatures[method] = MethodSignature(method)
+        return sig
+
 def check_no_params(method):
-    if any(inspect.getargspec(method)):
+    sig = method_signature(method)
+    if sig.names or sig.varargs or sig.varkw:
         raise CooperativeError, "Del has parameters."
 
 def check_all_params_are_keyword(method):
@@ -48,19 +119,51 @@ def check_all_params_are_keyword(method):
     named keyword parameter
     """
 
-    args, varargs, keywords, defaults = inspect.getargspec(method)
+    sig = method_signature(method)
 
-    # Always have self, thus the -1
-    if len(args or []) - 1 != len(defaults or []):
+    if sig.positional:
         raise CooperativeError, "Init has positional parameters " + \
-              str(args[1:])
-    if varargs:
+              str(list(sig.positional))
+    if sig.varargs:
         raise CooperativeError, "Init has variadic positional parameters"
-    if keywords:
+    if sig.varkw:
         raise CooperativeError, "Init has variadic keyword parameters"
 
+def check_not_generator(cls, method, inner):
+    """
+    Raises CooperativeError if 'method', overriding its namesake in
+    the bases of 'cls', is a generator function that needs the result
+    of the overrides below, that is, it is an 'inner' one, or if some
+    of those are generators and it is not an 'inner' one.  The chain
+    would only create their generators, and never run them.
+    """
+    name = method.__name__
+    if inspect.isgeneratorfunction(method):
+        if inner:
+            raise CooperativeError, \
+                  "Cooperative method (" + name + ") is a generator."
+    elif inner:
+        return
+    for c in cls.__mro__[1:]:
+        if name in c.__dict__:
+            value = c.__dict__[name]
+            step  = getattr(value, '_cooperative_step', None)
+            value = step.method if step else \
+                    getattr(value, 'wrapped_function', value)
+            if inspect.isgeneratorfunction(value):
+                raise CooperativeError, \
+                      "Cooperative method (" + name + \
+                      ") overrides a generator."
+
 def has_keywords(method):
-    return bool(inspect.getargspec(method)[3])
+    return bool(method_signature(method).keywords)
+
+def keyword_params(method):
+    """
+    Returns the names of the keyword parameters of 'method', i.e. the
+    ones that have a default value.
+    """
+    return method_signature(method).keywords
 
 def make_keyword_extractor(method):
     """
@@ -68,8 +171,7 @@ def make_keyword_extractor(method):
     dictionary 'keys' and returns them in a separate dictionary.
     """
 
-    args, _1, _2, defs = inspect.getargspec(method)
-    key_args = args[-len(defs or []):]
+    key_args = keyword_params(method)
     def extractor(keys):
         new = {}
         for a in key_args:
@@ -79,69 +181,1675 @@ def make_keyword_extractor(method):
         return new
     return extractor
 
-def decorate_cooperating(cls, method,
-                         fixed_keywords  = {},
-                         post_cooperate  = False,
-                         inner_cooperate = False):
-    # TODO: Cleanup this function is too big!
 
-    assert not post_cooperate or \
-           not inner_cooperate
+PRE_COOPERATE      = 'pre'
+POST_COOPERATE     = 'post'
+INNER_COOPERATE    = 'inner'
+PARALLEL_COOPERATE = 'parallel'
+REDUCE_COOPERATE   = 'reduce'
+SHORT_COOPERATE    = 'short'
 
-    method_name = method.__name__
+class CooperativeStep(object):
+    """
+    One override in a cooperative chain: the undecorated 'method'
+    defined in class 'owner', the 'kind' of cooperation and the
+    keywords it picks from and injects into the chain.  Unless
+    'checked', an inner cooperating method is trusted to call the
+    next method exactly once.  Reducing steps have the '(combine,
+    initial)' pair of their 'reducer', and 'stream' steps return
+    iterables to be chained.  The results of chains of cached steps
+    are kept as their '(maxsize, per_class)' 'cache' says.
+    """
+
+    def __init__(self, owner, method, kind, fixed_keywords={},
+                 checked=True, reducer=None, stream=False, cache=None):
+        self.owner          = owner
+        self.method         = method
+        self.kind           = kind
+        self.fixed_keywords = fixed_keywords
+        self.checked        = checked
+        self.reducer        = reducer
+        self.stream         = stream
+        self.cache          = cache
+
+    @property
+    def keywords(self):
+        # Only needed for the plans, not when the class is defined
+        return keyword_params(self.method)
+
+    def __repr__(self):
+        return '<CooperativeStep %s.%s (%s)>' % (
+            self.owner.__name__, self.method.__name__, self.kind)
+
+
+class DispatchPlan(object):
+    """
+    The overrides that a call to method 'name' goes through on an
+    instance of class 'cls'.  The 'steps' are the overrides that
+    cooperate via this library, in MRO order.  The 'terminal' is the
+    first definition after them that does not, i.e. the root
+    definition, a manual or non cooperative override or the one in
+    'object', as a '(owner, value)' pair, or None if there is none.
+    """
 
-    if method_name == '__init__':
-        check_all_params_are_keyword(method)
-    if method_name == '__del__':
-        check_no_params(method)
+    def __init__(self, cls, name, steps, terminal):
+        self.cls      = cls
+        self.name     = name
+        self.steps    = tuple(steps)
+        self.terminal = terminal
+
+    def __repr__(self):
+        return '<DispatchPlan %s.%s: %s>' % (
+            self.cls.__name__, self.name,
+            ' -> '.join([s.owner.__name__ + ':' + s.kind
+                         for s in self.steps] +
+                        ([self.terminal[0].__name__]
+                         if self.terminal else [])))
+
+def scan_overrides(classes, name):
+    """
+    Collects the cooperative steps and the terminal definition of
+    method 'name' in the sequence of 'classes'.
+    """
+    steps = []
+    for c in classes:
+        if name in c.__dict__:
+            value = c.__dict__[name]
+            step  = getattr(value, '_cooperative_step', None)
+            if step is None:
+                return steps, (c, value)
+            steps.append(step)
+    return steps, None
+
+def make_dispatch_plan(cls, name, step=None):
+    """
+    Computes the DispatchPlan for method 'name' on instances of
+    'cls'.  When 'step' is given, the plan starts at that override.
+    """
+    finalize_class(cls)
+    mro = cls.__mro__
+    if step is None:
+        steps, terminal = scan_overrides(mro, name)
+    else:
+        steps, terminal = scan_overrides(
+            mro[mro.index(step.owner) + 1:], name)
+        steps.insert(0, step)
+    return DispatchPlan(cls, name, steps, terminal)
+
+def dispatch_plan(cls, name):
+    """
+    Returns the DispatchPlan that calls to the cooperative method
+    'name' follow on instances of 'cls'.
+    """
+    return make_dispatch_plan(cls, name)
+
+
+DROP_KEYWORD = -1
+
+class KeywordRouting(object):
+    """
+    Tells where the keywords passed to a segment of a DispatchPlan end
+    up.  A segment goes from step 'start' until the end of the plan or
+    the first inner cooperating step, and 'stop' is the index after
+    its last step.  The 'table' maps the keywords to the index of the
+    step that picks them, or to DROP_KEYWORD when a fixed keyword
+    overrides them first.  The fixed keywords picked by some step are
+    in 'fixed', indexed by step.  The keywords not in the table go
+    past the segment, together with the 'rest_fixed' keywords.  When
+    'accepted' is not None, it is the set of keywords that the
+    terminal definition takes, and any other keyword is an error.
+    """
+
+    def __init__(self, plan, start=0):
+        steps = plan.steps
+        stop  = start
+        while stop < len(steps) and steps[stop].kind is not INNER_COOPERATE:
+            stop += 1
+        if stop < len(steps):
+            stop += 1
+            accepted = None
+        else:
+            accepted = accepted_keywords(plan.terminal)
+
+        table   = {}
+        fixed   = {}
+        pending = {}
+        for i in xrange(start, stop):
+            step = steps[i]
+            for key in step.keywords:
+                if key in pending:
+                    fixed.setdefault(i, {})[key] = pending.pop(key)
+                elif key not in table:
+                    table[key] = i
+            for key, value in step.fixed_keywords.iteritems():
+                table.setdefault(key, DROP_KEYWORD)
+                pending[key] = value
+
+        self.start      = start
+        self.stop       = stop
+        self.table      = table
+        self.fixed      = fixed
+        self.rest_fixed = pending
+        self.accepted   = accepted
+
+    def picked_by(self, index):
+        """
+        Returns the names of the keywords from the caller that the
+        step at 'index' picks.
+        """
+        return sorted(key for key, i in self.table.iteritems()
+                      if i == index)
+
+    def dropped(self):
+        return sorted(key for key, i in self.table.iteritems()
+                      if i == DROP_KEYWORD)
+
+def accepted_keywords(terminal):
+    """
+    Returns the set of keywords that the 'terminal' of a DispatchPlan
+    accepts, or None when that is unknown or it takes any keyword.
+    """
+    if terminal is None:
+        return None
+    value = terminal[1]
+    if value is object.__dict__['__init__']:
+        return frozenset()
+    if isinstance(value, types.FunctionType):
+        sig = method_signature(value)
+        return None if sig.varkw else frozenset(sig.names)
+    return None
+
+def check_unknown_keywords(plan, accepted, keys):
+    """
+    Raises CooperativeError if any keyword in 'keys' is not in the
+    'accepted' ones, before any override of 'plan' runs.
+    """
+    unknown = [key for key in keys if key not in accepted]
+    if unknown:
+        raise CooperativeError, \
+              "%s.%s() got unexpected keyword arguments: %s" % (
+                  plan.cls.__name__, plan.name, ', '.join(sorted(unknown)))
 
-    extractor = make_keyword_extractor(method)
 
-    if post_cooperate:
-        if has_keywords(method) or fixed_keywords:
-            def wrapper(self, *a, **orig):
-                ours = extractor(orig)
-                orig.update(fixed_keywords)
+_no_keywords = {}
+
+def _call_terminal(plan, self, a, orig):
+    terminal = plan.terminal
+    if terminal is None:
+        # Let super raise the same error as without the plan
+        owner = plan.steps[-1].owner
+        return getattr(super(owner, self), plan.name)(*a, **orig)
+    return terminal[1].__get__(self, plan.cls)(*a, **orig)
+
+class NextMethod(object):
+    """
+    What inner cooperating methods receive to call the rest of the
+    chain.  Calling it forwards the positional arguments and the
+    remaining keywords, updated with the ones passed to it, and
+    returns the result of the rest of the chain.  It must be called
+    or skipped exactly once, and only while the inner method runs:
+    instances are reused by later calls.
+    """
+
+    __slots__ = ('runner', 'obj', 'a', 'orig', 'called')
+
+    def __init__(self, runner):
+        self.runner = runner
+        self.called = True
+
+    def __call__(self, **kws):
+        if self.called:
+            raise CooperativeError, "Next method must be called exactly once."
+        self.called = True
+        orig = self.orig
+        if kws:
+            orig.update(kws)
+        return self.runner(self.obj, self.a, orig)
+
+    def skip(self):
+        """ Stops the chain here, instead of calling the rest. """
+        if self.called:
+            raise CooperativeError, "Next method must be called exactly once."
+        self.called = True
+
+def _run_inner(method, next_runner, pool, self, a, orig, ours):
+    # TODO: Maybe disregard this check for the sake of
+    # performance or some other patterns.
+    # Each call takes a NextMethod of its own from the pool, so
+    # concurrent and reentrant calls do not interfere.
+    try:
+        next_method = pool.pop()
+    except IndexError:
+        next_method = NextMethod(next_runner)
+    next_method.obj    = self
+    next_method.a      = a
+    next_method.orig   = orig
+    next_method.called = False
+    try:
+        result = method(self, next_method, *a, **ours)
+    finally:
+        called = next_method.called
+        next_method.obj = next_method.a = next_method.orig = None
+        next_method.called = True
+        pool.append(next_method)
+    if not called:
+        raise CooperativeError, "Next method must be called exactly once."
+    return result
+
+class UncheckedNextMethod(NextMethod):
+    """
+    NextMethod for release mode, that does not check that it is
+    called exactly once.
+    """
+
+    __slots__ = ()
+
+    def __call__(self, **kws):
+        orig = self.orig
+        if kws:
+            orig.update(kws)
+        return self.runner(self.obj, self.a, orig)
+
+    def skip(self):
+        pass
+
+def _run_inner_unchecked(method, next_runner, pool, self, a, orig, ours):
+    try:
+        next_method = pool.pop()
+    except IndexError:
+        next_method = UncheckedNextMethod(next_runner)
+    next_method.obj  = self
+    next_method.a    = a
+    next_method.orig = orig
+    try:
+        return method(self, next_method, *a, **ours)
+    finally:
+        next_method.obj = next_method.a = next_method.orig = None
+        pool.append(next_method)
+
+def inner_step_runner(step):
+    """
+    Returns the function that runs the inner cooperating 'step'.
+    """
+    return _run_inner if step.checked else _run_inner_unchecked
+
+def make_keyword_splitter(plan, routing):
+    """
+    Returns a function that splits a keywords dictionary in one pass
+    following 'routing', returning the list of the dictionaries for
+    every step in the segment and the one with the remaining keywords.
+    """
+    table      = routing.table
+    accepted   = routing.accepted
+    rest_fixed = routing.rest_fixed
+    start      = routing.start
+    initial    = tuple(routing.fixed.get(i, _no_keywords)
+                       for i in xrange(start, routing.stop))
+    if accepted is not None:
+        check_unknown_keywords(plan, accepted, rest_fixed)
+
+    def splitter(orig):
+        picked = list(initial)
+        rest   = rest_fixed
+        for key, value in orig.iteritems():
+            i = table.get(key)
+            if i is None:
+                if rest is rest_fixed:
+                    rest = dict(rest_fixed)
+                rest[key] = value
+            elif i != DROP_KEYWORD:
+                ours = picked[i - start]
+                if ours is initial[i - start]:
+                    ours = picked[i - start] = dict(ours)
+                ours[key] = value
+        if accepted is not None and rest:
+            check_unknown_keywords(plan, accepted, rest)
+        return picked, rest
+    return splitter
+
+def make_closure_runner(plan, index=0):
+    """
+    Returns a function that runs 'plan' from its 'index'-th step on,
+    when called with the instance, the positional arguments and the
+    keywords dictionary.  The function is a generic closure that
+    splits the keywords in one pass using the KeywordRouting of the
+    plan and then interprets the steps.
+    """
+    if is_parallel_plan(plan, index):
+        return make_parallel_runner(plan, index)
+    if plan_reducer(plan, index):
+        return make_reduce_runner(plan, index)
+    if is_stream_plan(plan, index):
+        return make_stream_runner(plan, index)
+    if is_short_plan(plan, index):
+        return make_short_runner(plan, index)
+    routing  = KeywordRouting(plan, index)
+    splitter = make_keyword_splitter(plan, routing)
+    hops     = []
+    for i in xrange(routing.start, routing.stop):
+        step = plan.steps[i]
+        if step.kind is INNER_COOPERATE:
+            # Inner steps carry the runner for the rest of the plan
+            # and their pool of NextMethod objects
+            hops.append((step.kind, step.method,
+                         (make_closure_runner(plan, i + 1), [],
+                          inner_step_runner(step))))
+        else:
+            hops.append((step.kind, step.method, None))
+    hops = tuple(hops)
+
+    def runner(self, a, orig):
+        picked, rest = splitter(orig)
+        deferred = []
+        for (kind, method, inner), ours in zip(hops, picked):
+            if kind is PRE_COOPERATE:
+                deferred.append((method, ours))
+            elif kind is POST_COOPERATE:
                 method(self, *a, **ours)
-                return getattr(super(cls, self), method_name)(*a, **orig)
+            else:
+                if rest is routing.rest_fixed:
+                    rest = dict(rest)
+                result = inner[2](method, inner[0], inner[1],
+                                  self, a, rest, ours)
+                break
+        else:
+            result = _call_terminal(plan, self, a, rest)
+        for method, ours in reversed(deferred):
+            result = method(self, *a, **ours)
+        return result
+    return runner
+
+
+class ParallelError(Exception):
+    """
+    Raised when overrides of a parallel cooperative method fail.  The
+    'errors' are '(owner, exception)' pairs for every override that
+    failed, in MRO order.
+    """
+
+    def __init__(self, errors):
+        super(ParallelError, self).__init__(
+            "%d overrides failed: %s" % (len(errors), ', '.join(
+                '%s: %r' % (owner.__name__, exc) for owner, exc in errors)))
+        self.errors = errors
+
+class _ImmediateResult(object):
+    __slots__ = ('value', 'exc_info')
+
+    def result(self):
+        if self.exc_info:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+
+class SerialExecutor(object):
+    """
+    Executor that runs what is submitted to it right away, in the
+    calling thread.
+    """
+
+    def submit(self, fn, *a, **k):
+        future = _ImmediateResult()
+        future.exc_info = None
+        try:
+            future.value = fn(*a, **k)
+        except Exception:
+            future.exc_info = sys.exc_info()
+        return future
+
+class ThreadPoolExecutor(object):
+    """
+    Executor that runs what is submitted to it in a pool of
+    'processes' threads, which is created on first use.  Overrides
+    are usually waiting on I/O, so by default there are five threads
+    per CPU.
+    """
+
+    def __init__(self, processes=None):
+        if processes is None:
+            from multiprocessing import cpu_count
+            processes = cpu_count() * 5
+        self.processes = processes
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *a, **k):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    from multiprocessing.pool import ThreadPool
+                    self._pool = ThreadPool(self.processes)
+        result = self._pool.apply_async(fn, a, k)
+        result.result = result.get
+        return result
+
+parallel_executor = None
+_serial_executor  = SerialExecutor()
+
+def set_parallel_executor(executor):
+    """
+    Sets the executor that runs the overrides of parallel cooperative
+    methods.  It can be any object with a 'submit(fn, *args, **kws)'
+    method that returns an object with a 'result()' method, like the
+    ones in 'concurrent.futures'.  By default, a ThreadPoolExecutor
+    is created on first use.
+    """
+    global parallel_executor
+    parallel_executor = executor
+
+def get_parallel_executor():
+    global parallel_executor
+    if parallel_executor is None:
+        parallel_executor = ThreadPoolExecutor()
+    return parallel_executor
+
+# Whether this thread is running an override of a parallel method
+_parallel_local = threading.local()
+
+def _run_override(fn, *a, **k):
+    _parallel_local.running = True
+    try:
+        return fn(*a, **k)
+    finally:
+        _parallel_local.running = False
+
+def _is_plan_of_kind(plan, index, kind, adjective):
+    kinds = set(step.kind for step in plan.steps[index:])
+    if kind not in kinds:
+        return False
+    if len(kinds) > 1:
+        raise CooperativeError, \
+              adjective + " cooperative method (" + plan.name + \
+              ") mixed with other kinds of cooperation."
+    return True
+
+def is_parallel_plan(plan, index=0):
+    """
+    Returns whether the steps of 'plan' from 'index' on are parallel.
+    Raises CooperativeError if only some of them are.
+    """
+    return _is_plan_of_kind(plan, index, PARALLEL_COOPERATE, "Parallel")
+
+def make_parallel_runner(plan, index=0):
+    """
+    Returns a function that runs the overrides of 'plan', all of them
+    parallel, concurrently in the 'parallel_executor'.  It returns the
+    result of the first override and raises ParallelError when any of
+    them fails.  When called from an override of a parallel method, it
+    runs them one after the other in the calling thread instead, as
+    waiting for the executor from one of its threads may deadlock.
+    """
+    routing  = KeywordRouting(plan, index)
+    splitter = make_keyword_splitter(plan, routing)
+    methods  = [step.method for step in plan.steps[index:]]
+    owners   = [step.owner for step in plan.steps[index:]]
+    if plan.terminal:
+        owners.append(plan.terminal[0])
+
+    def runner(self, a, orig):
+        picked, rest = splitter(orig)
+        if getattr(_parallel_local, 'running', False):
+            submit = _serial_executor.submit
+        else:
+            submit = partial(get_parallel_executor().submit, _run_override)
+        futures = [submit(method, self, *a, **ours)
+                   for method, ours in zip(methods, picked)]
+        if plan.terminal:
+            futures.append(submit(_call_terminal, plan, self, a, rest))
+        results = []
+        errors  = []
+        for owner, future in zip(owners, futures):
+            try:
+                results.append(future.result())
+            except Exception, exc:
+                errors.append((owner, exc))
+        if errors:
+            raise ParallelError(errors)
+        return results[0]
+    return runner
+
+
+def plan_reducer(plan, index=0):
+    """
+    Returns the reducer of the steps of 'plan' from 'index' on if
+    they are reducing, or None.  Raises CooperativeError if only some
+    of them are, or not all with the same reducer.
+    """
+    steps = plan.steps[index:]
+    if not any(step.kind is REDUCE_COOPERATE for step in steps):
+        return None
+    reducer = steps[0].reducer
+    if any(step.kind is not REDUCE_COOPERATE or step.reducer != reducer
+           for step in steps):
+        raise CooperativeError, \
+              "Reducing cooperative method (" + plan.name + \
+              ") mixed with other kinds of cooperation."
+    return reducer
+
+def make_reduce_runner(plan, index=0):
+    """
+    Returns a function that runs the overrides of 'plan', all of them
+    reducing, in the same order as pre-cooperating ones, and returns
+    their results combined into a single accumulator.
+    """
+    combine, initial = plan_reducer(plan, index)
+    fresh    = callable(initial)
+    routing  = KeywordRouting(plan, index)
+    splitter = make_keyword_splitter(plan, routing)
+    methods  = tuple(step.method for step in plan.steps[index:])[::-1]
+
+    def runner(self, a, orig):
+        picked, rest = splitter(orig)
+        acc = combine(initial() if fresh else initial,
+                      _call_terminal(plan, self, a, rest))
+        for method, ours in zip(methods, reversed(picked)):
+            acc = combine(acc, method(self, *a, **ours))
+        return acc
+    return runner
+
+
+def is_stream_plan(plan, index=0):
+    """
+    Returns whether the steps of 'plan' from 'index' on stream.
+    Raises CooperativeError if only some of them do.
+    """
+    streams = set(step.stream for step in plan.steps[index:])
+    if True not in streams:
+        return False
+    if len(streams) > 1:
+        raise CooperativeError, \
+              "Streaming cooperative method (" + plan.name + \
+              ") mixed with other kinds of cooperation."
+    return True
+
+def _run_inner_stream(method, next_method, self, a, ours):
+    for item in method(self, next_method, *a, **ours):
+        yield item
+    if not next_method.called:
+        raise CooperativeError, "Next method must be called exactly once."
+
+def make_stream_runner(plan, index=0):
+    """
+    Returns a function that runs 'plan', all of whose overrides
+    stream, returning an iterator that chains what they produce in
+    the order they would run in.  Every override is only called when
+    the iterables of the previous ones are exhausted.
+    """
+    routing  = KeywordRouting(plan, index)
+    splitter = make_keyword_splitter(plan, routing)
+    steps    = plan.steps[routing.start:routing.stop]
+    methods  = tuple(step.method for step in steps)
+    posts    = tuple(i for i, step in enumerate(steps)
+                     if step.kind is POST_COOPERATE)
+    pres     = tuple(i for i, step in enumerate(steps)
+                     if step.kind is PRE_COOPERATE)[::-1]
+    inner    = None
+    if steps and steps[-1].kind is INNER_COOPERATE:
+        # The stream outlives the call, so its NextMethod can not
+        # come from a pool
+        inner = (len(steps) - 1, make_stream_runner(plan, routing.stop),
+                 steps[-1].checked)
+
+    def streams(self, a, picked, rest):
+        for i in posts:
+            yield methods[i](self, *a, **picked[i])
+        if inner is None:
+            yield _call_terminal(plan, self, a, rest)
         else:
-            def wrapper(self, *a, **orig):
-                method(self, *a)
-                return getattr(super(cls, self), method_name)(*a, **orig)
-
-    elif inner_cooperate:
-        assert not fixed_keywords
-        # TODO: Maybe disregard this check for the sake of
-        # performance or some other patterns.
-        inner_call_count = [0]
-        def wrapper(self, *a, **orig):
-            ours = extractor(orig)
-            orig.update(fixed_keywords)
-            next_fn = getattr(super(cls, self), method_name)
-            def next_method(**kws):
-                inner_call_count[0] += 1
-                orig.update(kws)
-                next_fn(*a, **orig)
-            result = method(self, next_method, *a, **ours)
-            if inner_call_count[0] != 1:
-                raise CooperativeError, "Next method must be called exactly once."
-            inner_call_count[0] = 0
-            return result
+            i, next_runner, checked = inner
+            if rest is routing.rest_fixed:
+                rest = dict(rest)
+            next_method = (NextMethod if checked else
+                           UncheckedNextMethod)(next_runner)
+            next_method.obj    = self
+            next_method.a      = a
+            next_method.orig   = rest
+            next_method.called = not checked
+            if checked:
+                yield _run_inner_stream(methods[i], next_method,
+                                        self, a, picked[i])
+            else:
+                yield methods[i](self, next_method, *a, **picked[i])
+        for i in pres:
+            yield methods[i](self, *a, **picked[i])
 
+    def runner(self, a, orig):
+        picked, rest = splitter(orig)
+        return chain.from_iterable(streams(self, a, picked, rest))
+    return runner
+
+
+def is_short_plan(plan, index=0):
+    """
+    Returns whether the steps of 'plan' from 'index' on short-circuit.
+    Raises CooperativeError if only some of them do.
+    """
+    return _is_plan_of_kind(plan, index, SHORT_COOPERATE, "Short-circuit")
+
+def make_short_runner(plan, index=0):
+    """
+    Returns a function that runs the overrides of 'plan', all of them
+    short-circuiting, from the most derived one until one returns
+    something other than None, which is the result.  The root only
+    runs if all of them return None.
+    """
+    routing  = KeywordRouting(plan, index)
+    splitter = make_keyword_splitter(plan, routing)
+    methods  = tuple(step.method for step in plan.steps[index:])
+
+    def runner(self, a, orig):
+        picked, rest = splitter(orig)
+        for method, ours in zip(methods, picked):
+            result = method(self, *a, **ours)
+            if result is not None:
+                return result
+        return _call_terminal(plan, self, a, rest)
+    return runner
+
+
+_identifier = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+_literal_types = (type(None), bool, int, long, float, str, unicode)
+
+def _constant(namespace, name, value):
+    """
+    Returns an expression for 'value' in generated code, either as a
+    literal or through a new global 'name' in 'namespace', or some
+    other one when 'name' is not a valid identifier.
+    """
+    if type(value) in _literal_types and \
+       not (type(value) is float and math.isinf(value) or value != value):
+        return repr(value)
+    if not _identifier.match(name) or iskeyword(name):
+        name = '_c%d' % len(namespace)
+    while name in namespace:
+        name += '_'
+    namespace[name] = value
+    return name
+
+# Descriptors that can be called directly with the instance
+_unbound_types = (types.FunctionType,
+                  type(object.__init__),
+                  type(object.__format__))
+
+def make_plan_source(plan, index=0):
+    """
+    Returns the source of a function that does what the runners from
+    'make_closure_runner' do, but specialized for 'plan': the keyword
+    routing is unrolled into one lookup per keyword that some method
+    takes, fixed keywords are inlined as constants and there is no
+    loop over the steps.  Also returns the namespace the source has to
+    be executed in.
+    """
+    assert not is_parallel_plan(plan, index)
+    assert not is_stream_plan(plan, index)
+    short     = is_short_plan(plan, index)
+    routing   = KeywordRouting(plan, index)
+    namespace = { '_no_keywords': _no_keywords,
+                  '_plan':        plan }
+    defaults = []
+    picks    = []
+    posts    = []
+    pres     = []
+    for i in xrange(routing.start, routing.stop):
+        step   = plan.steps[i]
+        fn     = '_m%d' % i
+        keys   = routing.picked_by(i)
+        fixed  = sorted(routing.fixed.get(i, {}).iteritems())
+        ours   = 'k%d' % i if keys or fixed else None
+        kwargs = ', **' + ours if ours else ''
+        namespace[fn] = step.method
+        if ours:
+            fixed = ['%r: %s' % (key, _constant(
+                        namespace, '_c%d_%s' % (i, key), value))
+                     for key, value in fixed]
+            if routing.fixed.get(i):
+                namespace['_f%d' % i] = routing.fixed[i]
+                defaults.append('%s = _f%d' % (ours, i))
+            else:
+                defaults.append('%s = _no_keywords' % ours)
+        if keys:
+            picks.extend(_pick_source(ours, keys, fixed))
+        if step.kind is PRE_COOPERATE or step.kind is REDUCE_COOPERATE:
+            pres.append('%s(self, *a%s)' % (fn, kwargs))
+        elif step.kind is POST_COOPERATE:
+            posts.append('%s(self, *a%s)' % (fn, kwargs))
+        elif short:
+            posts.extend(['result = %s(self, *a%s)' % (fn, kwargs),
+                          'if result is not None: return result'])
+        else:
+            namespace['_next%d' % i] = make_codegen_runner(plan, i + 1)
+            namespace['_pool%d' % i] = []
+            namespace['_inner%d' % i] = inner_step_runner(step)
+            last = '_inner%d(%s, _next%d, _pool%d, self, a, orig, %s)' % (
+                i, fn, i, i, ours or '_no_keywords')
+
+    for key in routing.dropped():
+        picks.append('orig.pop(%r, None)' % key)
+    checks = []
+    if routing.accepted is not None:
+        check_unknown_keywords(plan, routing.accepted, routing.rest_fixed)
+        namespace['_accepted'] = routing.accepted
+        namespace['check_unknown_keywords'] = check_unknown_keywords
+        checks.append('check_unknown_keywords(_plan, _accepted, orig)')
+    rest = ['orig[%r] = %s' % (key, _constant(
+               namespace, '_c_%s' % key, value))
+            for key, value in sorted(routing.rest_fixed.iteritems())]
+
+    if routing.stop == routing.start or \
+       plan.steps[routing.stop - 1].kind is not INNER_COOPERATE:
+        terminal = plan.terminal
+        kwargs   = '' if routing.accepted == frozenset() and not rest \
+                   else ', **orig'
+        if terminal is None:
+            namespace['_call_terminal'] = _call_terminal
+            last = '_call_terminal(_plan, self, a, orig)'
+        elif isinstance(terminal[1], _unbound_types):
+            namespace['_terminal'] = terminal[1]
+            last = '_terminal(self, *a%s)' % kwargs
+        else:
+            namespace['_terminal'] = terminal[1]
+            namespace['_cls'] = plan.cls
+            last = '_terminal.__get__(self, _cls)(*a%s)' % kwargs
+
+    # Routing keywords has no visible effects other than on 'orig', so
+    # it can all happen upfront, and most of the time there are no
+    # keywords at all.  Pre-cooperating methods run after the rest of
+    # the chain, the outermost last.
+    calls = posts + [last] + pres[::-1]
+    reducer = plan_reducer(plan, index)
+    if reducer:
+        # The accumulator is created once and threaded through
+        namespace['_combine'], namespace['_initial'] = reducer
+        calls = ['acc = _combine(%s, %s)' % (
+                     '_initial()' if callable(reducer[1]) else '_initial',
+                     last)] + \
+                ['acc = _combine(acc, %s)' % call for call in pres[::-1]] + \
+                ['acc']
+    lines = ['def run(self, a, orig):']
+    lines.extend('    ' + line for line in defaults)
+    if picks or checks:
+        lines.append('    if orig:')
+        lines.extend('        ' + line for line in picks)
+        if checks:
+            lines.append('        if orig:')
+            lines.extend('            ' + line for line in checks)
+    lines.extend('    ' + line for line in rest)
+    lines.extend('    ' + call for call in calls[:-1])
+    lines.append('    return ' + calls[-1])
+    return '\n'.join(lines) + '\n', namespace
+
+def _pick_source(var, keywords, fixed):
+    if len(keywords) == 1:
+        key = keywords[0]
+        return [ 'if %r in orig:' % key,
+                 '    %s = {%s}' % (var, ', '.join(
+                     ['%r: orig.pop(%r)' % (key, key)] + fixed)) ]
+    lines = [ '%s = {%s}' % (var, ', '.join(fixed)) ]
+    for key in keywords:
+        lines.extend([ 'if %r in orig:' % key,
+                       '    %s[%r] = orig.pop(%r)' % (var, key, key) ])
+    return lines
+
+def make_codegen_runner(plan, index=0):
+    """
+    Returns a function like 'make_closure_runner' does, but compiled
+    from the source generated by 'make_plan_source'.
+    """
+    if is_parallel_plan(plan, index):
+        return make_parallel_runner(plan, index)
+    if is_stream_plan(plan, index):
+        return make_stream_runner(plan, index)
+    source, namespace = make_plan_source(plan, index)
+    return compile_source(
+        source, namespace,
+        '<cooper %s.%s:%d>' % (plan.cls.__name__, plan.name, index))
+
+def compile_source(source, namespace, filename):
+    """
+    Executes the generated 'source' of a function named 'run' in
+    'namespace' and returns the function.
+    """
+    # Make the generated source show up in tracebacks
+    linecache.cache[filename] = (len(source), None,
+                                 source.splitlines(True), filename)
+    exec compile(source, filename, 'exec') in namespace
+    return namespace['run']
+
+
+CLOSURE_BACKEND = 'closure'
+CODEGEN_BACKEND = 'codegen'
+
+plan_runner_makers = {
+    CLOSURE_BACKEND: make_closure_runner,
+    CODEGEN_BACKEND: make_codegen_runner,
+}
+
+wrapper_backend = CODEGEN_BACKEND
+
+def set_wrapper_backend(backend):
+    """
+    Chooses how the cooperative methods decorated from now on run
+    their dispatch plans, either 'CODEGEN_BACKEND' (the default) or
+    'CLOSURE_BACKEND'.
+    """
+    global wrapper_backend
+    if backend not in plan_runner_makers:
+        raise ValueError("Unknown wrapper backend: " + repr(backend))
+    wrapper_backend = backend
+
+def make_plan_runner(plan, index=0, backend=None):
+    """
+    Returns a function that runs 'plan' using the given 'backend', or
+    the current 'wrapper_backend' by default.  While profiling, it
+    returns an instrumented runner instead.  The whole plan is cached
+    when its steps are and it starts at the most derived override.
+    """
+    if active_profile is not None:
+        runner = make_profiled_runner(plan, active_profile, index)
     else:
-        if has_keywords(method) or fixed_keywords:
-            def wrapper(self, *a, **orig):
-                ours = extractor(orig)
-                orig.update(fixed_keywords)
-                getattr(super(cls, self), method_name)(*a, **orig)
-                return method(self, *a, **ours)
+        runner = plan_runner_makers[backend or wrapper_backend](plan, index)
+    cache = plan_cache(plan) if index == 0 else None
+    if cache:
+        # Plans starting below, through 'super' from a manual override,
+        # give only part of the result that is cached for the method
+        steps = scan_overrides(plan.cls.__mro__, plan.name)[0]
+        if steps and steps[0] is plan.steps[0]:
+            runner = make_cached_runner(plan, runner, cache)
+    return runner
+
+_classes_with_runners = weakref.WeakSet()
+
+def class_runners(cls):
+    """
+    Returns the dictionary with the runners made for instances of
+    'cls', each of them with 'cls' itself, by the step they start at
+    or, for batch runners, by '(batch_runner, name)'.
+    It is kept in the class, instead of in the wrappers or a global
+    table, so that they do not keep dynamically made classes alive.
+    """
+    runners = cls.__dict__.get('_cooperative_runners')
+    if runners is None:
+        runners = {}
+        # Built-in types can not keep them, but have no chains either
+        if cls.__flags__ & _heap_type:
+            setattr(cls, '_cooperative_runners', runners)
+            _classes_with_runners.add(cls)
+    return runners
+
+def clear_plan_runners():
+    """
+    Forgets the runners of every cooperative method, so that they are
+    made again on their next call.
+    """
+    for cls in list(_classes_with_runners):
+        cls.__dict__['_cooperative_runners'].clear()
+
+
+class CallCache(object):
+    """
+    Results of the calls to a cached cooperative method, by their
+    arguments.  It keeps at most 'maxsize' of them, forgetting the
+    oldest first.  Results of calls that started before the cache was
+    last cleared are not stored.
+    """
+
+    __slots__ = ('entries', 'order', 'maxsize', 'version')
+
+    def __init__(self, maxsize):
+        # A plain dictionary is faster to look up than an OrderedDict
+        self.entries = {}
+        self.order   = deque()
+        self.maxsize = maxsize
+        self.version = 0
+
+    def store(self, key, value, version):
+        with _caches_lock:
+            entries = self.entries
+            if version == self.version and key not in entries:
+                if len(entries) >= self.maxsize:
+                    del entries[self.order.popleft()]
+                entries[key] = value
+                self.order.append(key)
+
+    def clear(self):
+        with _caches_lock:
+            self.version += 1
+            self.entries.clear()
+            self.order.clear()
+
+# Reentrant, as collecting an instance while it is held forgets its caches
+_caches_lock     = threading.RLock()
+_class_caches    = weakref.WeakKeyDictionary()
+_instance_caches = {}
+
+def plan_cache(plan):
+    """
+    Returns the 'cache' of the steps of 'plan', or None.  Raises
+    CooperativeError if only some of them are cached, or not all the
+    same way.
+    """
+    caches = set(step.cache for step in plan.steps)
+    if caches == set([None]) or not caches:
+        return None
+    if len(caches) > 1:
+        raise CooperativeError, \
+              "Cached cooperative method (" + plan.name + \
+              ") mixed with other kinds of cooperation."
+    return caches.pop()
+
+def _class_cache(cls, name, maxsize):
+    with _caches_lock:
+        caches = _class_caches.setdefault(cls, {})
+        if name not in caches:
+            caches[name] = CallCache(maxsize)
+        return caches[name]
+
+def _instance_cache(obj, name, maxsize):
+    key = id(obj)
+    with _caches_lock:
+        entry = _instance_caches.get(key)
+        if entry is None:
+            def forget(ref):
+                with _caches_lock:
+                    if _instance_caches.get(key, (None,))[0] is ref:
+                        del _instance_caches[key]
+            entry = _instance_caches[key] = (weakref.ref(obj, forget), {})
+        caches = entry[1]
+        if name not in caches:
+            caches[name] = CallCache(maxsize)
+        return caches[name]
+
+class _KeywordsKey(object):
+    pass
+
+def make_cached_runner(plan, runner, cache):
+    """
+    Returns a function that returns the results of 'runner' kept in
+    the cache of the instance, or of the concrete class of 'plan' if
+    'cache' says so, and only calls 'runner' when they are missing.
+    Calls with arguments that can not be hashed are not cached, nor
+    are those of instances that can not be weakly referenced.
+    """
+    maxsize, per_class = cache
+    name = plan.name
+    if per_class:
+        shared = _class_cache(plan.cls, name, maxsize)
+    elif not plan.cls.__weakrefoffset__:
+        # Their caches could not be forgotten when they are collected
+        return runner
+
+    def cached(self, a, orig):
+        if per_class:
+            cache = shared
         else:
-            def wrapper(self, *a, **orig):
-                getattr(super(cls, self), method_name)(*a, **orig)
-                return method(self, *a)
+            try:
+                cache = _instance_caches[id(self)][1][name]
+            except KeyError:
+                cache = _instance_cache(self, name, maxsize)
+        key = (a, frozenset(orig.iteritems()), _KeywordsKey) if orig else a
+        try:
+            return cache.entries[key]
+        except KeyError:
+            pass
+        except TypeError:
+            return runner(self, a, orig)
+        version = cache.version
+        result  = runner(self, a, orig)
+        cache.store(key, result, version)
+        return result
+    return cached
+
+def invalidate_cache(obj, name=None):
+    """
+    Forgets the cached results of the method 'name' of 'obj', or of
+    all its methods.  Every result is of the whole chain, so any of
+    its overrides can do it.  When 'obj' is a class, this forgets the
+    results of its subclasses and of all their instances too.
+    """
+    if isinstance(obj, type):
+        classes = set()
+        pending = [obj]
+        while pending:
+            cls = pending.pop()
+            if cls not in classes:
+                classes.add(cls)
+                pending.extend(type.__subclasses__(cls))
+        with _caches_lock:
+            caches = [c for cls in classes
+                      for c in _class_caches.get(cls, {}).iteritems()]
+            caches.extend(c for ref, methods in _instance_caches.values()
+                          if isinstance(ref(), obj)
+                          for c in methods.iteritems())
+    else:
+        with _caches_lock:
+            entry = _instance_caches.get(id(obj))
+            caches = entry[1].items() if entry and entry[0]() is obj else []
+    for key, cache in caches:
+        if name is None or key == name:
+            cache.clear()
+
+
+class Profile(object):
+    """
+    Statistics of the calls to every cooperative override while
+    profiling.  For every '(class, method name)' it counts the calls
+    and the time spent in them, both including the rest of the chain
+    below the override and excluding it.
+    """
+
+    def __init__(self):
+        self.stats  = {}
+        self._local = threading.local()
+        self._lock  = threading.Lock()
+
+    def call(self, key, keywords, fn, *a):
+        """
+        Calls 'fn' with arguments 'a', accounting the time to 'key',
+        an override that takes the 'keywords' dictionary.
+        """
+        try:
+            stack = self._local.stack
+        except AttributeError:
+            stack = self._local.stack = []
+        stack.append(0.0)
+        start = default_timer()
+        try:
+            return fn(*a)
+        finally:
+            elapsed = default_timer() - start
+            nested  = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                entry = self.stats.get(key)
+                if entry is None:
+                    entry = self.stats[key] = [0, 0.0, 0.0]
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] += elapsed - nested
+
+    def as_dict(self):
+        """
+        Returns the statistics as a dictionary that maps every
+        '(class, method name)' to a dictionary with its number of
+        'calls' and its 'inclusive' and 'exclusive' times.
+        """
+        with self._lock:
+            return dict((key, { 'calls':     calls,
+                                'inclusive': inclusive,
+                                'exclusive': exclusive })
+                        for key, (calls, inclusive, exclusive)
+                        in self.stats.iteritems())
+
+    def table(self, sort_by='exclusive'):
+        """
+        Returns the statistics as a text table, sorted by decreasing
+        'calls', 'inclusive' or 'exclusive' time.
+        """
+        rows = sorted(self.as_dict().iteritems(),
+                      key=lambda (key, stat): stat[sort_by], reverse=True)
+        lines = ['%-40s %8s %12s %12s' % (
+            'override', 'calls', 'inclusive', 'exclusive')]
+        for (cls, name), stat in rows:
+            lines.append('%-40s %8d %12.6f %12.6f' % (
+                cls.__name__ + '.' + name, stat['calls'],
+                stat['inclusive'], stat['exclusive']))
+        return '\n'.join(lines)
+
+active_profile = None
+
+def start_profiling(profile=None):
+    """
+    Makes cooperative methods record their calls in 'profile', or in
+    a new Profile, which is returned.  Anything with a 'call' method
+    like the one of Profile can be used, like a Trace.
+    """
+    global active_profile
+    active_profile = profile or Profile()
+    clear_plan_runners()
+    return active_profile
+
+def stop_profiling():
+    """
+    Stops profiling and returns the Profile that was active.  The
+    cooperative methods go back to their plain runners, so profiling
+    costs nothing when it is off.
+    """
+    global active_profile
+    profile, active_profile = active_profile, None
+    clear_plan_runners()
+    return profile
+
+@contextmanager
+def profiling(profile=None):
+    """
+    Context in which cooperative methods are profiled, returning the
+    Profile from 'start_profiling'.
+    """
+    profile = start_profiling(profile)
+    try:
+        yield profile
+    finally:
+        stop_profiling()
+
+class Trace(object):
+    """
+    Records the begin and end of the calls to every cooperative
+    override, with the keywords it takes, as events in the Chrome
+    trace event format.  Only the last 'capacity' events are kept.
+    """
+
+    def __init__(self, capacity=100000):
+        self.pid    = os.getpid()
+        self.buffer = deque(maxlen=capacity)
+
+    def call(self, key, keywords, fn, *a):
+        """
+        Calls 'fn' with arguments 'a', recording it as a call to 'key',
+        an override that takes the 'keywords' dictionary.
+        """
+        name   = key[0].__name__ + '.' + key[1]
+        tid    = thread.get_ident()
+        append = self.buffer.append
+        append(('B', name, tid, default_timer(),
+                keywords and sorted(keywords)))
+        try:
+            return fn(*a)
+        finally:
+            append(('E', name, tid, default_timer(), None))
+
+    def events(self):
+        """
+        Returns the recorded events, without the ends of the calls
+        whose begin was dropped from the buffer.
+        """
+        events = []
+        depths = {}
+        for phase, name, tid, time, keywords in list(self.buffer):
+            depth = depths.get(tid, 0)
+            if phase == 'E':
+                if not depth:
+                    continue
+                depths[tid] = depth - 1
+            else:
+                depths[tid] = depth + 1
+            event = { 'name': name, 'cat': 'cooper', 'ph': phase,
+                      'ts': time * 1e6, 'pid': self.pid, 'tid': tid }
+            if keywords:
+                event['args'] = { 'keywords': keywords }
+            events.append(event)
+        return events
+
+    def dump(self, out):
+        """
+        Writes the events as JSON to file 'out', that can be opened
+        with 'chrome://tracing' or Perfetto.
+        """
+        json.dump({ 'traceEvents': self.events(),
+                    'displayTimeUnit': 'ms' }, out)
+
+@contextmanager
+def tracing(capacity=100000):
+    """
+    Context in which the calls to cooperative methods are traced,
+    returning the Trace.
+    """
+    with profiling(Trace(capacity)) as trace:
+        yield trace
+
+def make_profiled_runner(plan, profile, index=0):
+    """
+    Returns a function that runs 'plan' like 'make_closure_runner'
+    does, but where every override is called inside the previous
+    one, as with super, and is accounted in 'profile'.  Parallel and
+    streaming overrides are accounted as a whole, to the first one,
+    and the latter only while their iterator is made.
+    """
+    if is_parallel_plan(plan, index) or is_stream_plan(plan, index):
+        runner = (make_parallel_runner if is_parallel_plan(plan, index)
+                  else make_stream_runner)(plan, index)
+        key = (plan.steps[index].owner, plan.name)
+        return lambda self, a, orig: profile.call(
+            key, orig, runner, self, a, orig)
+
+    routing  = KeywordRouting(plan, index)
+    splitter = make_keyword_splitter(plan, routing)
+    call     = profile.call
+    reducer  = plan_reducer(plan, index)
+    hops     = []
+    for i in xrange(routing.start, routing.stop):
+        step  = plan.steps[i]
+        inner = None
+        if step.kind is INNER_COOPERATE:
+            inner = (make_profiled_runner(plan, profile, i + 1), [],
+                     inner_step_runner(step))
+        hops.append((step.kind, step.method, (step.owner, plan.name), inner))
+    terminal = plan.terminal and (plan.terminal[0], plan.name)
+    # Only to raise when short-circuiting steps are mixed
+    is_short_plan(plan, index)
+
+    def runner(self, a, orig):
+        picked, rest = splitter(orig)
+        def run(j):
+            if j == len(hops):
+                if terminal is None:
+                    result = _call_terminal(plan, self, a, rest)
+                else:
+                    result = call(terminal, rest, _call_terminal,
+                                  plan, self, a, rest)
+                if reducer:
+                    combine, initial = reducer
+                    result = combine(initial() if callable(initial)
+                                     else initial, result)
+                return result
+            kind, method, key, inner = hops[j]
+            ours = picked[j]
+            if kind is PRE_COOPERATE:
+                def override():
+                    run(j + 1)
+                    return method(self, *a, **ours)
+            elif kind is REDUCE_COOPERATE:
+                def override():
+                    acc = run(j + 1)
+                    return reducer[0](acc, method(self, *a, **ours))
+            elif kind is POST_COOPERATE:
+                def override():
+                    method(self, *a, **ours)
+                    return run(j + 1)
+            elif kind is SHORT_COOPERATE:
+                def override():
+                    result = method(self, *a, **ours)
+                    return run(j + 1) if result is None else result
+            else:
+                def override():
+                    return inner[2](method, inner[0], inner[1],
+                                    self, a, dict(rest), ours)
+            return call(key, ours, override)
+        return run(0)
+    return runner
+
+
+def plan_terminal(plan):
+    """
+    Returns a function that calls the terminal of 'plan' with the
+    instance, the positional arguments and the remaining keywords.
+    """
+    if plan.terminal and isinstance(plan.terminal[1], _unbound_types):
+        return plan.terminal[1]
+    def terminal(obj, *a, **k):
+        return _call_terminal(plan, obj, a, k)
+    return terminal
+
+def make_batch_runner(plan):
+    """
+    Returns a function that calls the method of 'plan' on a sequence
+    of instances of its class, all with the same positional arguments
+    and keywords dictionary, returning the list of results.  The
+    keywords are split only once for the whole sequence, unless some
+    step is inner, parallel, streams or is cached, since those need a
+    dictionary of their own on every call, or while profiling.
+    """
+    steps = plan.steps
+    if not steps and plan.terminal is None:
+        name = plan.name
+        def batch(objects, a, orig):
+            return [getattr(obj, name)(*a, **orig) for obj in objects]
+        return batch
+
+    if active_profile is not None or plan_cache(plan) or \
+       any(step.kind in (INNER_COOPERATE, PARALLEL_COOPERATE) or step.stream
+           for step in steps):
+        runner = make_plan_runner(plan)
+        def batch(objects, a, orig):
+            return [runner(obj, a, dict(orig)) for obj in objects]
+        return batch
+
+    routing  = KeywordRouting(plan)
+    splitter = make_keyword_splitter(plan, routing)
+    terminal = plan_terminal(plan)
+
+    reducer = plan_reducer(plan)
+    if reducer:
+        combine, initial = reducer
+        fresh   = callable(initial)
+        methods = [step.method for step in steps][::-1]
+        def batch(objects, a, orig):
+            picked, rest = splitter(orig)
+            hops = zip(methods, reversed(picked))
+            results = []
+            append  = results.append
+            for obj in objects:
+                acc = combine(initial() if fresh else initial,
+                              terminal(obj, *a, **rest))
+                for method, ours in hops:
+                    acc = combine(acc, method(obj, *a, **ours))
+                append(acc)
+            return results
+        return batch
+
+    if is_short_plan(plan):
+        methods = [step.method for step in steps]
+        def batch(objects, a, orig):
+            picked, rest = splitter(orig)
+            hops = zip(methods, picked)
+            results = []
+            append  = results.append
+            for obj in objects:
+                for method, ours in hops:
+                    result = method(obj, *a, **ours)
+                    if result is not None:
+                        break
+                else:
+                    result = terminal(obj, *a, **rest)
+                append(result)
+            return results
+        return batch
+
+    def batch(objects, a, orig):
+        picked, rest = splitter(orig)
+        posts = [(step.method, ours) for step, ours in zip(steps, picked)
+                 if step.kind is POST_COOPERATE]
+        pres  = [(step.method, ours) for step, ours in zip(steps, picked)
+                 if step.kind is PRE_COOPERATE][::-1]
+        results = []
+        append  = results.append
+        for obj in objects:
+            for method, ours in posts:
+                method(obj, *a, **ours)
+            result = terminal(obj, *a, **rest)
+            for method, ours in pres:
+                result = method(obj, *a, **ours)
+            append(result)
+        return results
+    return batch
+
+def batch_runner(cls, name):
+    """
+    Returns the function from 'make_batch_runner' for method 'name' on
+    instances of 'cls', computing it only the first time.
+    """
+    key = (batch_runner, name)
+    try:
+        owner, batch = cls._cooperative_runners[key]
+    except (AttributeError, KeyError):
+        owner = None
+    if owner is not cls:
+        batch = make_batch_runner(dispatch_plan(cls, name))
+        class_runners(cls)[key] = (cls, batch)
+    return batch
+
+def group_by_type(objects):
+    """
+    Returns a list of '(cls, indices, objects)' for every concrete
+    class in the 'objects' sequence, in order of first appearance.
+    """
+    groups = {}
+    order  = []
+    for i, obj in enumerate(objects):
+        cls = type(obj)
+        try:
+            group = groups[cls]
+        except KeyError:
+            group = groups[cls] = ([], [])
+            order.append(cls)
+        group[0].append(i)
+        group[1].append(obj)
+    return [(cls,) + groups[cls] for cls in order]
+
+def call_all(objects, method_name, *a, **kws):
+    """
+    Calls method 'method_name' with the given arguments on every
+    object in the 'objects' sequence, and returns the list of results
+    in the same order.  Objects are grouped by their concrete class,
+    for which the chain of overrides is resolved and the keywords
+    split once, and then every group is called in a tight loop.  This
+    means that objects of different classes may be called in a
+    different order than they are in 'objects'.
+    """
+    objects = list(objects)
+    groups  = group_by_type(objects)
+    if len(groups) == 1:
+        return batch_runner(groups[0][0], method_name)(objects, a, kws)
+    results = [None] * len(objects)
+    for cls, indices, group in groups:
+        batch = batch_runner(cls, method_name)
+        for i, result in zip(indices, batch(group, a, kws)):
+            results[i] = result
+    return results
+
+def call_all_chunked(executor, chunk_size, objects, method_name, *a, **kws):
+    """
+    Like 'call_all', but the groups of objects of the same class are
+    cut into chunks of at most 'chunk_size' objects that are submitted
+    to 'executor', which is like the ones for 'set_parallel_executor'.
+    If any chunk fails, the first error is raised after all of them
+    are done.
+    """
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be positive: " + repr(chunk_size))
+    objects = list(objects)
+    chunks  = []
+    for cls, indices, group in group_by_type(objects):
+        batch = batch_runner(cls, method_name)
+        for start in xrange(0, len(group), chunk_size):
+            stop = start + chunk_size
+            chunks.append((indices[start:stop], executor.submit(
+                batch, group[start:stop], a, kws)))
+    results = [None] * len(objects)
+    error   = None
+    for indices, future in chunks:
+        try:
+            chunk = future.result()
+        except Exception:
+            if error is None:
+                error = sys.exc_info()
+            continue
+        for i, result in zip(indices, chunk):
+            results[i] = result
+    if error:
+        raise error[0], error[1], error[2]
+    return results
+
+
+def make_create_source(plan, keys, by_index):
+    """
+    Returns the source of a function that creates an instance of the
+    class of 'plan', an '__init__' plan with only pre and post
+    cooperating steps, from a row 'r' with the given 'keys', which is
+    indexed by position if 'by_index' or by key otherwise.  The
+    keywords of the row are routed and checked when the source is
+    generated.  Also returns the namespace the source has to be
+    executed in.
+    """
+    routing   = KeywordRouting(plan)
+    namespace = { '_cls': plan.cls, '_new': plan.cls.__new__ }
+    values    = dict((key, 'r[%r]' % (j if by_index else key))
+                     for j, key in enumerate(keys))
+    args      = dict((i, []) for i in xrange(len(plan.steps)))
+    rest      = []
+    for key in keys:
+        i = routing.table.get(key)
+        if i is None:
+            rest.append(key)
+        elif i != DROP_KEYWORD:
+            args[i].append(key)
+    if routing.accepted is not None:
+        check_unknown_keywords(plan, routing.accepted,
+                               routing.rest_fixed.keys() + rest)
+
+    def call(fn, i, picked, fixed):
+        kws = [(key, values[key]) for key in sorted(picked)] + \
+              [(key, _constant(namespace, '_c%s_%s' % (i, key), value))
+               for key, value in sorted(fixed.iteritems())]
+        return '%s(obj%s)' % (fn, _kwargs_source(kws))
+
+    posts = []
+    pres  = []
+    for i, step in enumerate(plan.steps):
+        namespace['_m%d' % i] = step.method
+        line = call('_m%d' % i, i, args[i], routing.fixed.get(i, {}))
+        (posts if step.kind is POST_COOPERATE else pres).append(line)
+    namespace['_terminal'] = plan_terminal(plan)
+    terminal = call('_terminal', '', rest, routing.rest_fixed)
+
+    lines = ['def run(r):']
+    if plan.cls.__new__ is object.__new__:
+        lines.append('    obj = _new(_cls)')
+    else:
+        lines.append('    obj = _new(_cls%s)' % _kwargs_source(
+            [(key, values[key]) for key in keys]))
+    lines.extend('    ' + line for line in posts + [terminal] + pres[::-1])
+    lines.append('    return obj')
+    return '\n'.join(lines) + '\n', namespace
+
+def _kwargs_source(pairs):
+    if not pairs:
+        return ''
+    if all(_identifier.match(key) and not iskeyword(key)
+           for key, expr in pairs):
+        return ', ' + ', '.join('%s=%s' % pair for pair in pairs)
+    return ', **{%s}' % ', '.join('%r: %s' % pair for pair in pairs)
+
+def make_row_constructor(plan, keys, by_index):
+    """
+    Returns the function whose source 'make_create_source' generates.
+    """
+    source, namespace = make_create_source(plan, keys, by_index)
+    return compile_source(source, namespace, '<cooper %s.create:%s>' % (
+        plan.cls.__name__, ','.join(keys)))
+
+def create_many(cls, rows=None, columns=None):
+    """
+    Generates new instances of 'cls', one for every dictionary of
+    constructor keywords in 'rows', or, when 'columns' is given
+    instead, a dictionary that maps every keyword to the sequence of
+    its values, one for every instance.  The constructor keywords are
+    routed and checked once for every different set of keywords,
+    instead of once per instance.  Rows are consumed as instances are
+    generated, so they can come from a generator too.  Columns of
+    different lengths raise ValueError, when their lengths are known.
+    """
+    if (rows is None) == (columns is None):
+        raise TypeError("create_many() takes either rows or columns")
+    if columns is not None and len(set(
+            len(values) for values in columns.itervalues()
+            if hasattr(values, '__len__'))) > 1:
+        raise ValueError("create_many() columns have different lengths")
+    # Getting the plan finalizes the class, as '_finalizing_call' does
+    plan = dispatch_plan(cls, '__init__')
+    call = type(cls).__call__
+    if call is not type.__call__ and \
+       getattr(call, 'im_func', None) is not _finalizing_call or \
+       active_profile is not None or \
+       any(step.kind is not PRE_COOPERATE and
+           step.kind is not POST_COOPERATE for step in plan.steps):
+        # Metaclasses may do anything on construction, other kinds of
+        # cooperation need the keywords of every call and profiling
+        # needs the plan runners
+        if columns is not None:
+            keys = tuple(columns)
+            rows = (dict(izip(keys, values))
+                    for values in izip(*[columns[key] for key in keys]))
+        for row in rows:
+            yield cls(**row)
+        return
+
+    if columns is not None:
+        keys   = tuple(columns)
+        create = make_row_constructor(plan, keys, True)
+        for values in izip(*[columns[key] for key in keys]):
+            yield create(values)
+        return
+
+    constructors = {}
+    last_keys    = None
+    for row in rows:
+        if last_keys is None or row.viewkeys() != last_keys:
+            last_keys = frozenset(row)
+            try:
+                create = constructors[last_keys]
+            except KeyError:
+                create = constructors[last_keys] = make_row_constructor(
+                    plan, tuple(sorted(row)), False)
+        yield create(row)
+
+
+release_mode = not __debug__ or bool(os.environ.get('COOPER_RELEASE'))
+
+def set_release_mode(enabled):
+    """
+    Chooses whether the methods decorated from now on skip the checks
+    that only catch programmer errors: the signatures of '__init__'
+    and '__del__' and that inner cooperating methods call the next
+    method exactly once.  It is enabled by default when Python runs
+    with '-O' or when the COOPER_RELEASE environment variable is set.
+    """
+    global release_mode
+    release_mode = enabled
+
+def get_release_mode():
+    """ Returns whether methods decorated now skip the checks. """
+    return release_mode
+
+
+def decorate_cooperating(cls, method,
+                         fixed_keywords     = {},
+                         post_cooperate     = False,
+                         inner_cooperate    = False,
+                         parallel_cooperate = False,
+                         reducer            = None,
+                         stream             = False,
+                         short_cooperate    = False):
+    method_name = method.__name__
+
+    if not release_mode and not is_validated(cls):
+        assert sum((post_cooperate, inner_cooperate, parallel_cooperate,
+                    reducer is not None, short_cooperate)) <= 1
+        assert not stream or \
+               not (parallel_cooperate or reducer or short_cooperate)
+        assert not inner_cooperate or \
+               not fixed_keywords
+        if stream and method_name in ('__init__', '__del__'):
+            raise CooperativeError, \
+                  "Cooperative method (" + method_name + ") can not stream."
+        if method_name == '__init__':
+            check_all_params_are_keyword(method)
+        if method_name == '__del__':
+            check_no_params(method)
+    if not stream and not is_validated(cls):
+        check_not_generator(cls, method, inner_cooperate)
+
+    kind = INNER_COOPERATE    if inner_cooperate    else \
+           POST_COOPERATE     if post_cooperate     else \
+           PARALLEL_COOPERATE if parallel_cooperate else \
+           REDUCE_COOPERATE   if reducer            else \
+           SHORT_COOPERATE    if short_cooperate    else \
+           PRE_COOPERATE
+    step = CooperativeStep(cls, method, kind, fixed_keywords,
+                           checked = not release_mode,
+                           reducer = reducer,
+                           stream  = stream)
+    backend = wrapper_backend
+
+    # The plans are computed once for every concrete class that
+    # reaches this override, instead of going through super on every
+    # hop of the chain.  The runners found in a super-class are its
+    # own, not of the concrete class.
+    def wrapper(self, *a, **orig):
+        concrete = type(self)
+        try:
+            owner, runner = concrete._cooperative_runners[step]
+        except (AttributeError, KeyError):
+            owner = None
+        if owner is not concrete:
+            runner = make_plan_runner(
+                make_dispatch_plan(concrete, method_name, step), 0, backend)
+            class_runners(concrete)[step] = (concrete, runner)
+        return runner(self, a, orig)
 
     wrapper = wraps(method)(wrapper)
     wrapper.__objclass__ = cls
+    wrapper._cooperative_step = step
     return wrapper
 
 
@@ -158,6 +1866,21 @@ class CoopDecorator(object):
     def __call__(self, cls):
         return decorate_cooperating(cls, self.wrapped_function)
 
+    def __get__(self, obj, cls=None):
+        # Decorators are only found in classes that are pending
+        # finalization, in which case accessing them finalizes the
+        # class and returns whatever replaced them.
+        if cls is None:
+            cls = type(obj)
+        finalize_class(cls)
+        name = self.wrapped_function.__name__
+        for c in cls.__mro__:
+            if name in c.__dict__:
+                if c.__dict__[name] is self:
+                    return self
+                break
+        return getattr(cls if obj is None else obj, name)
+
 
 class cooperative(CoopDecorator):
     def __call__(self, cls):
@@ -184,23 +1907,141 @@ class inner_cooperate(CoopDecorator):
         return decorate_cooperating(cls, self.wrapped_function,
                                     inner_cooperate = True)
 
+class parallel_cooperate(CoopDecorator):
+    """
+    Marks the overrides of a method as independent of each other, so
+    they run concurrently in the 'parallel_executor'.  All the
+    overrides in the chain, but the root, must be parallel.
+    """
+    def __call__(self, cls):
+        return decorate_cooperating(cls, self.wrapped_function,
+                                    parallel_cooperate = True)
+
+class short_cooperate(CoopDecorator):
+    """
+    Marks overrides that may handle a call by themselves.  They run
+    from the most derived one, and the first that returns something
+    other than None stops the chain: the classes above it, root
+    included, are not called.  All the overrides in the chain, but
+    the root, must short-circuit.
+    """
+    def __call__(self, cls):
+        return decorate_cooperating(cls, self.wrapped_function,
+                                    short_cooperate = True)
+
+class stream_cooperate(CoopDecorator):
+    """
+    Marks overrides that produce many items, usually generators.  A
+    call returns one iterator over the items of the root and then of
+    every override, from the base to the most derived one.  Each of
+    them runs only once the items of the previous are consumed.  All
+    the overrides in the chain, but the root, must stream.
+    """
+    def __call__(self, cls):
+        return decorate_cooperating(cls, self.wrapped_function,
+                                    stream = True)
+
+class post_stream_cooperate(CoopDecorator):
+    """
+    Like 'stream_cooperate', but the items of this override go
+    before the ones of the super-classes.
+    """
+    def __call__(self, cls):
+        return decorate_cooperating(cls, self.wrapped_function,
+                                    post_cooperate = True,
+                                    stream = True)
+
+class inner_stream_cooperate(CoopDecorator):
+    """
+    Like 'inner_cooperate' for streams: calling 'next_method' returns
+    the iterator of the super-classes, to be spliced anywhere in the
+    items of this override.
+    """
+    def __call__(self, cls):
+        return decorate_cooperating(cls, self.wrapped_function,
+                                    inner_cooperate = True,
+                                    stream = True)
+
 class manual_cooperate(CoopDecorator):
     def __call__(self, cls):
         return self.wrapped_function
 
+def reduce_cooperate(combine, initial):
+    """
+    Returns a decorator for overrides whose results are gathered
+    into one accumulator along the chain, from the root to the most
+    derived one, which is what a call returns.  The accumulator
+    starts as 'initial', or what it returns if it is callable, and
+    every result is added with 'combine(accumulator, result)', which
+    returns the new accumulator.  All the overrides in the chain, but
+    the root, must reduce the same way.
+    """
+    class ReduceCooperate(CoopDecorator):
+        def __call__(self, cls):
+            return decorate_cooperating(cls, self.wrapped_function,
+                                        reducer = self.reducer)
+    ReduceCooperate.reducer = (combine, initial)
+    return ReduceCooperate
+
+def _extend(acc, result):
+    acc.extend(result)
+    return acc
+
+def _merge(acc, result):
+    acc.update(result)
+    return acc
+
+def _all(acc, result):
+    return acc and bool(result)
+
+def _any(acc, result):
+    return acc or bool(result)
+
+extend_cooperate = reduce_cooperate(_extend, list)
+merge_cooperate  = reduce_cooperate(_merge, dict)
+sum_cooperate    = reduce_cooperate(operator.add, 0)
+all_cooperate    = reduce_cooperate(_all, True)
+any_cooperate    = reduce_cooperate(_any, False)
+
+def cached_cooperate(decorator=None, maxsize=128, per_class=False):
+    """
+    Returns a decorator like 'decorator', 'cooperate' by default, for
+    overrides of a method that is a pure query.  The result of the
+    whole chain is kept for every instance, or every class when
+    'per_class', and for every set of arguments, up to 'maxsize' of
+    them.  Use 'invalidate_cache' when it changes.  All the overrides
+    in the chain, but the root, must be cached the same way.
+    """
+    if maxsize < 1:
+        raise ValueError("Cache size must be positive: " + repr(maxsize))
+    class CachedCooperate(decorator or cooperate):
+        def __call__(self, cls):
+            wrapper = super(CachedCooperate, self).__call__(cls)
+            step = getattr(wrapper, '_cooperative_step', None)
+            if step is None:
+                raise CooperativeError, \
+                      "Cached cooperative method (" + \
+                      wrapper.__name__ + ") does not cooperate."
+            step.cache = self.cache
+            return wrapper
+    CachedCooperate.cache = (maxsize, per_class)
+    return CachedCooperate
+
 def cooperate_with_params(**keywords):
-    class FixedParams(CoopDecorator):
+    class FixedParams(cooperate):
         def __call__(self, cls):
             return decorate_cooperating(cls, self.wrapped_function,
-                                        fixed_keywords = keywords)
+                                        fixed_keywords = self.fixed_keywords)
+    FixedParams.fixed_keywords = keywords
     return FixedParams
 
 def post_cooperate_with_params(**keywords):
-    class FixedParams(CoopDecorator):
+    class FixedParams(post_cooperate):
         def __call__(self, cls):
             return decorate_cooperating(cls, self.wrapped_function,
-                                        fixed_keywords = keywords,
+                                        fixed_keywords = self.fixed_keywords,
                                         post_cooperate = True)
+    FixedParams.fixed_keywords = keywords
     return FixedParams
 
 
@@ -230,35 +2071,92 @@ def get_abstract_methods(cls):
                   cls.__dict__.itervalues())
 
 
-def check_single_root(cls, name):
+def cooperative_roots(cls):
+    """
+    Returns the index of the cooperative methods of 'cls': a dictionary
+    from their names to the tuple of classes that declare them
+    cooperative.  The tuple has more than one class when there are
+    conflicting declarations.  Cooperative classes keep their index,
+    which is built by merging the ones of their bases.
+    """
+    finalize_class(cls)
+    try:
+        return cls.__dict__['_cooperative_roots']
+    except KeyError:
+        return merge_cooperative_roots(cls.__bases__)
+
+def merge_cooperative_roots(bases):
+    indexes = filter(None, map(cooperative_roots, bases))
+    if len(indexes) == 1:
+        return indexes[0]
+    merged = {}
+    for index in indexes:
+        for name, roots in index.iteritems():
+            old = merged.setdefault(name, roots)
+            if old is not roots:
+                merged[name] = old + tuple(r for r in roots if r not in old)
+    return merged
+
+
+def check_single_root(cls, name, roots=None):
     # TODO: Do full method override checking at least in debug mode.
-    basic = filter(lambda c: getattr(getattr(c, name, None),
-                                     '_cooperative_is_root', False),
-                   cls.__mro__)
-    if len(basic) > 1:
+    if roots is None:
+        roots = merge_cooperative_roots(cls.__bases__)
+    if len(roots.get(name, ())) > 1:
         raise CooperativeError, \
               "Cooperative method (" + name + ") has conflicting declarations."
 
 
+def check_cooperation_kinds(cls, name):
+    """
+    Raises CooperativeError if the overrides of method 'name' in the
+    MRO of 'cls' mix kinds of cooperation that can not be mixed, so
+    that it fails when the class is defined instead of when called.
+    """
+    steps, terminal = scan_overrides(cls.__mro__, name)
+    plan = DispatchPlan(cls, name, steps, terminal)
+    is_parallel_plan(plan)
+    plan_reducer(plan)
+    is_stream_plan(plan)
+    is_short_plan(plan)
+    plan_cache(plan)
+
 def decorate_cooperative_methods(cls):
+    roots = merge_cooperative_roots(cls.__bases__)
+    new_roots = []
+    checked = not is_validated(cls)
     for name, value in cls.__dict__.iteritems():
         if name != '__init__':
-            check_single_root(cls, name)
+            if checked:
+                check_single_root(cls, name, roots)
             if isinstance(value, CoopDecorator):
-                if overrides_method(cls, name):
+                # The index says most of the time whether there is
+                # something to override without looking at the MRO
+                if name in roots or overrides_method(cls, name):
                     wrapped = value(cls)
                 else:
                     wrapped = value.wrapped_function
                     wrapped._cooperative_is_root = True
+                    new_roots.append(name)
                 wrapped._cooperative_is_coop = True
                 setattr(cls, name, wrapped)
-            elif overrides_cooperative(cls, name):
+            elif checked and name in roots and \
+                 overrides_cooperative(cls, name):
                 # TODO: This enforces explicit cooperation. This
                 # contradicts behaviour for __init__. Should we make
                 # this consistent either by making it optionally
                 # implicit or enforcing it explicity for __init__
                 raise CooperativeError, \
                       "Overriding cooperative method without cooperation"
+    if checked:
+        # Other bases may bring in overrides of other kinds
+        for name in roots if len(cls.__bases__) > 1 else \
+                    [name for name in cls.__dict__ if name in roots]:
+            check_cooperation_kinds(cls, name)
+    if new_roots:
+        roots = dict(roots)
+        roots.update((name, (cls,)) for name in new_roots)
+    cls._cooperative_roots = roots
 
 
 def decorate_init(cls):
@@ -275,26 +2173,609 @@ def decorate_del(cls):
     if defines_method(cls, '__del__'):
         fin = cls.__dict__['__del__']
         if isinstance(fin, CoopDecorator):
-            wrapped_fin = fin(cls)
+            if overrides_method(cls, '__del__'):
+                wrapped_fin = fin(cls)
+            else:
+                # Unlike __init__, 'object' has no finalizer to call
+                if not release_mode and not is_validated(cls):
+                    check_no_params(fin.wrapped_function)
+                wrapped_fin = fin.wrapped_function
         else:
             raise CooperativeError, \
                   "Finalizer should cooperate in cooperative class"
         cls.__del__ = wrapped_fin
 
 
-def cooperative_class(cls):
-    check_cooperative_bases(cls)
-    cls.__abstractmethods__ = frozenset(get_abstract_methods(cls))
+_finalizers       = {}
+_finalizers_lock  = threading.Lock()
+_finalizers_order = count()
+
+def add_finalizer(cls, obj, fn, *a, **k):
+    """
+    Registers 'fn' to be called with the given arguments when 'obj' is
+    closed or collected, or at exit, on behalf of its base 'cls', as
+    in 'super(cls, obj)'.  The finalizers of an object run in the
+    order of the MRO, as with 'post_cooperate', and those of the same
+    class in the reverse order they were added in.  Unlike '__del__',
+    they do not prevent the collection of reference cycles, but they
+    must not refer to 'obj'.
+    """
+    try:
+        index = type(obj).__mro__.index(cls)
+    except ValueError:
+        raise CooperativeError, \
+              "Finalizer added for a class the object is not an instance of"
+    if not type(obj).__weakrefoffset__:
+        raise CooperativeError, \
+              "Finalized object can not be weakly referenced"
+    if not release_mode and (
+            getattr(fn, 'im_self', None) is obj or
+            any(x is obj for x in a) or
+            any(x is obj for x in k.itervalues())):
+        raise CooperativeError, \
+              "Finalizer should not refer to the finalized object"
+    key = id(obj)
+    with _finalizers_lock:
+        chain = _finalizers.get(key)
+        if chain is None:
+            chain = _finalizers[key] = (
+                weakref.ref(obj, lambda ref: _run_finalizers(key, None)),
+                next(_finalizers_order), [])
+        chain[2].append((index, fn, a, k))
+
+def _pop_finalizers(key, obj):
+    with _finalizers_lock:
+        chain = _finalizers.get(key)
+        if chain is None or chain[0]() is not obj:
+            return None
+        del _finalizers[key]
+    return chain
+
+def _call_finalizers(callbacks):
+    error = None
+    # The sort is stable, so those of the same class stay reversed
+    for index, fn, a, k in sorted(reversed(callbacks),
+                                  key=lambda callback: callback[0]):
+        try:
+            fn(*a, **k)
+        except Exception:
+            if error is None:
+                error = sys.exc_info()
+    if error is not None:
+        raise error[0], error[1], error[2]
+
+def _run_finalizers(key, obj):
+    chain = _pop_finalizers(key, obj)
+    if chain is not None:
+        _call_finalizers(chain[2])
+    return chain is not None
+
+def close(obj):
+    """
+    Runs the finalizers of 'obj' now, unless they already ran, and
+    returns whether they did.  When some of them fail the rest still
+    run, and then the first error is raised.
+    """
+    return _run_finalizers(id(obj), obj)
+
+def has_finalizers(obj):
+    """
+    Returns whether 'obj' has finalizers that did not run yet.
+    """
+    chain = _finalizers.get(id(obj))
+    return chain is not None and chain[0]() is obj
+
+@atexit.register
+def _close_all():
+    with _finalizers_lock:
+        chains = sorted(_finalizers.itervalues(),
+                        key=lambda chain: chain[1], reverse=True)
+        _finalizers.clear()
+    for chain in chains:
+        try:
+            _call_finalizers(chain[2])
+        except Exception:
+            sys.excepthook(*sys.exc_info())
+
+
+lazy_finalization = False
+
+def set_lazy_finalization(enabled):
+    """
+    When enabled, the cooperative classes defined from now on are
+    finalized lazily: their cooperative methods are only checked and
+    decorated when the class is first instantiated or one of those is
+    first accessed, or when 'finalize_all' is called.
+    """
+    global lazy_finalization
+    lazy_finalization = enabled
+
+_pending_classes = weakref.WeakKeyDictionary()
+_finalize_lock   = threading.RLock()
+
+def finalize_class(cls):
+    """
+    Finalizes 'cls' and its bases if they are pending finalization.
+    When that fails, the class is left half decorated, so the same
+    error is raised again every time it is finalized.
+    """
+    if not _pending_classes:
+        return
+    with _finalize_lock:
+        for c in reversed(cls.__mro__):
+            error = _pending_classes.get(c)
+            if error is True:
+                try:
+                    decorate_cooperative_class(c)
+                except Exception, error:
+                    _pending_classes[c] = error
+                    raise
+                del _pending_classes[c]
+            elif error is not None:
+                raise error
+
+def pending_finalization(cls):
+    """
+    Returns whether 'cls' is a lazy cooperative class that has not
+    been finalized yet, nor failed to.
+    """
+    return _pending_classes.get(cls) is True
+
+def finalize_all():
+    """
+    Finalizes every cooperative class that is pending finalization.
+    """
+    for cls in _pending_classes.keys():
+        finalize_class(cls)
+
+def _finalizing_call(cls, *a, **k):
+    # Overrides that do not cooperate are only found when finalizing
+    if cls in _pending_classes:
+        finalize_class(cls)
+    return type.__call__(cls, *a, **k)
+
+def hides_cooperative_methods(cls):
+    """
+    Returns whether 'cls' overrides a cooperative method of its bases
+    with something that is not a cooperative decorator, which does not
+    finalize the class when it is accessed.
+    """
+    for name, value in cls.__dict__.iteritems():
+        if isinstance(value, CoopDecorator):
+            continue
+        for base in cls.__mro__[1:]:
+            if name in base.__dict__:
+                value = base.__dict__[name]
+                if isinstance(value, CoopDecorator) or \
+                   hasattr(value, '_cooperative_step') or \
+                   getattr(value, '_cooperative_is_root', False):
+                    return True
+                break
+    return False
+
+def decorate_cooperative_class(cls):
     decorate_init(cls)
     decorate_del(cls)
     decorate_cooperative_methods(cls)
+
+validation_manifest = None
+
+def set_validation_manifest(manifest):
+    """
+    Sets the 'manifest' of the cooperative classes that are known to
+    pass the checks, as written by 'python -m cooper.validate', or
+    disables it when 'None'.  It maps module names to dictionaries
+    from class names to the hashes of the passing versions of their
+    code.  The classes defined from now on that are listed with their
+    current hash skip the checks, and are finalized lazily as they can
+    not fail.
+    """
+    global validation_manifest
+    validation_manifest = manifest
+
+def load_validation_manifest(path):
+    """
+    Reads the manifest in 'path' and sets it as the validation
+    manifest.
+    """
+    with open(path) as f:
+        classes = json.load(f)['classes']
+    set_validation_manifest(dict(
+        (str(module), dict((str(name), frozenset(map(str, hashes)))
+                           for name, hashes in names.iteritems()))
+        for module, names in classes.iteritems()))
+
+# Set on the class by this library, or while hashing it
+_unhashed_names = frozenset([
+    '__abstractmethods__', '__new__', '_cooperative_hash',
+    '_cooperative_is_coop', '_cooperative_layout', '_cooperative_roots',
+    '_cooperative_runners', '_cooperative_state_codec',
+    '_cooperative_state_functions', '_cooperative_validated'])
+
+# Types defined in C, like 'object', can not change
+_heap_type     = 1 << 9
+_static_hashes = {}
+
+def _hash_name(value):
+    return (getattr(value, '__module__', None),
+            getattr(value, '__name__', repr(value)))
+
+def decorator_hash_key(value):
+    """
+    Returns the part of 'class_hash' for the method decorated with
+    'value': the classes of the decorator and the reducer, cache and
+    fixed keywords it cooperates with, as the decorator classes made
+    by 'reduce_cooperate' and the like share their names.
+    """
+    if not isinstance(value, CoopDecorator):
+        return type(value).__name__
+    reducer  = getattr(value, 'reducer', None)
+    keywords = getattr(value, 'fixed_keywords', None)
+    return ([c.__name__ for c in type(value).__mro__],
+            reducer and map(_hash_name, reducer),
+            getattr(value, 'cache', None),
+            keywords and sorted(keywords))
+
+def class_hash(cls):
+    """
+    Returns a hash of the parts of the code of 'cls' and its bases
+    that the checks look at, i.e. the names and kinds of the methods
+    and their parameters, so it changes whenever the result of
+    checking 'cls' may change.  Cooperative classes store the one of
+    the code they were defined with, as their methods are replaced
+    afterwards.
+    """
+    dct    = cls.__dict__
+    stored = dct.get('_cooperative_hash') or _static_hashes.get(cls)
+    if stored is not None:
+        return stored
+    names = [name for name in sorted(dct) if name not in _unhashed_names]
+    key   = [cls.__module__, cls.__name__, names]
+    key.extend(class_hash(base) for base in cls.__bases__)
+    for name in names:
+        value = dct[name]
+        if type(value) is types.FunctionType:
+            fn = value
+        elif isinstance(value, CoopDecorator):
+            fn = value.wrapped_function
+        else:
+            continue
+        code = fn.func_code
+        key.append((name, decorator_hash_key(value), code.co_argcount,
+                    code.co_flags, len(fn.func_defaults or ())))
+    digest = hashlib.sha1(marshal.dumps(key)).hexdigest()
+    if not cls.__flags__ & _heap_type:
+        _static_hashes[cls] = digest
+    return digest
+
+def is_validated(cls):
+    """
+    Returns whether the checks on 'cls' were skipped because the
+    validation manifest lists it.
+    """
+    return cls.__dict__.get('_cooperative_validated', False)
+
+def validate_with_manifest(cls):
+    if validation_manifest is not None:
+        digest = cls._cooperative_hash = class_hash(cls)
+        if digest in validation_manifest.get(cls.__module__, {}) \
+                                        .get(cls.__name__, ()):
+            cls._cooperative_validated = True
+
+if os.environ.get('COOPER_MANIFEST'):
+    load_validation_manifest(os.environ['COOPER_MANIFEST'])
+
+def _declared_names(cls, *attrs):
+    # The first of 'attrs' that each class declares counts
+    names = []
+    for c in reversed(cls.__mro__):
+        for attr in attrs:
+            if attr in c.__dict__:
+                declared = c.__dict__[attr]
+                if isinstance(declared, basestring):
+                    declared = (declared,)
+                names.extend(name for name in declared if name not in names)
+                break
+    return tuple(names)
+
+def cooperative_slots(cls):
+    """
+    Returns the names of the fields that 'cls' and its bases declare
+    in their '__cooperative_slots__', from the most basic class on.
+    """
+    return _declared_names(cls, '__cooperative_slots__')
+
+_layout_lock = threading.Lock()
+
+def slot_layout(cls):
+    """
+    Returns the class whose instances are created for 'cls' when some
+    of its bases declare '__cooperative_slots__'.  It is a subclass
+    of 'cls' with the same name and all the fields as '__slots__', so
+    that no two bases of the hierarchy have conflicting layouts.  It
+    is created only the first time.
+    """
+    layout = cls.__dict__.get('_cooperative_layout')
+    if layout is None:
+        with _layout_lock:
+            layout = cls.__dict__.get('_cooperative_layout')
+            if layout is None:
+                slots = cooperative_slots(cls)
+                if not cls.__weakrefoffset__:
+                    slots += ('__weakref__',)
+                layout = type(cls)(cls.__name__, (cls,), {
+                    '__slots__':  slots,
+                    '__module__': cls.__module__ })
+                if not isinstance(layout, CooperativeMeta):
+                    cooperative_class(layout)
+                layout._cooperative_layout = layout
+                cls._cooperative_layout = layout
+    return layout
+
+def _new_with_slots(cls, *a, **k):
+    return object.__new__(slot_layout(cls))
+
+def cooperative_state(cls):
+    """
+    Returns the names of the fields that make the state of the
+    instances of 'cls', from the most basic class on.  Every class
+    contributes its '__cooperative_state__' or, when it declares none,
+    its '__cooperative_slots__'.
+    """
+    return _declared_names(cls, '__cooperative_state__',
+                           '__cooperative_slots__')
+
+class _Unset(object):
+    """ Marks the fields that were not set in a saved state. """
+
+def _wrong_state(obj, state):
+    raise CooperativeError, "State of (%s) should have %d fields, not %d" % (
+        type(obj).__name__, len(state_codec(type(obj))[2]), len(state))
+
+def make_state_source(cls, fields):
+    """
+    Returns the sources of the functions that get the state of an
+    instance of 'cls', a tuple with the 'fields' in order, and that
+    set it.  When the instances have a '__dict__', its other entries
+    are saved in a dictionary at the end of the tuple, or None.  Also
+    returns the namespace the sources have to be executed in.
+    """
+    for name in fields:
+        if not _identifier.match(name) or iskeyword(name):
+            raise CooperativeError, \
+                  "State field (" + name + ") is not an identifier"
+    namespace = { '_getattr': getattr, '_unset': _Unset,
+                  '_fields':  frozenset(fields), '_wrong': _wrong_state }
+    size = len(fields) + bool(cls.__dictoffset__)
+    get  = ['def run(o):',
+            '    try:',
+            '        state = (%s)' % ''.join('o.%s, ' % f for f in fields),
+            '    except AttributeError:',
+            '        state = (%s)' % ''.join(
+                '_getattr(o, %r, _unset), ' % f for f in fields)]
+    set  = ['def run(o, s):',
+            '    if len(s) != %d:' % size,
+            '        _wrong(o, s)']
+    if cls.__dictoffset__:
+        set.append('    d = o.__dict__')
+    for i, name in enumerate(fields):
+        # Storing in the dictionary skips looking for a descriptor
+        # that is not there
+        set.extend(['    v = s[%d]' % i,
+                    '    if v is not _unset:',
+                    '        d[%r] = v' % name
+                    if cls.__dictoffset__ and not hasattr(cls, name) else
+                    '        o.%s = v' % name])
+    if cls.__dictoffset__:
+        get.extend(['    d = o.__dict__',
+                    '    extra = d.viewkeys() - _fields',
+                    '    return state + ({ k: d[k] for k in extra }'
+                    ' if extra else None,)'])
+        set.extend(['    if s[-1]:',
+                    '        d.update(s[-1])'])
+    else:
+        get.append('    return state')
+    return '\n'.join(get) + '\n', '\n'.join(set) + '\n', namespace
+
+def state_codec(cls):
+    """
+    Returns the functions that get and set the state of the instances
+    of 'cls', as generated by 'make_state_source', and the names of
+    the fields.  They are compiled only the first time.
+    """
+    codec = cls.__dict__.get('_cooperative_state_codec')
+    if codec is None:
+        fields = cooperative_state(cls)
+        get, set, namespace = make_state_source(cls, fields)
+        name  = '<cooper %s.%%s>' % cls.__name__
+        codec = (compile_source(get, dict(namespace), name % 'getstate'),
+                 compile_source(set, dict(namespace), name % 'setstate'),
+                 fields)
+        cls._cooperative_state_codec = codec
+    return codec
+
+def public_class(cls):
+    """
+    Returns 'cls', or the class it is the slot layout of.
+    """
+    if cls.__dict__.get('_cooperative_layout') is cls:
+        return cls.__bases__[0]
+    return cls
+
+def _getstate(self):
+    return state_codec(type(self))[0](self)
+
+def _setstate(self, state):
+    state_codec(type(self))[1](self, state)
+
+def _new_instance(cls):
+    return cls.__new__(cls)
+
+def _state_functions(cls):
+    # Subclasses may still save and restore their state their own way
+    functions = cls.__dict__.get('_cooperative_state_functions')
+    if functions is None:
+        get, set = cls.__getstate__, cls.__setstate__
+        if getattr(get, 'im_func', None) is _getstate:
+            get = state_codec(cls)[0]
+        if getattr(set, 'im_func', None) is _setstate:
+            set = state_codec(cls)[1]
+        own_reduce = cls.__reduce__ is not object.__reduce__
+        functions = cls._cooperative_state_functions = (get, set, own_reduce)
+    return functions
+
+def _reduce_ex(self, protocol):
+    # Restoring creates the object with '__new__', without '__init__'.
+    # Pickle only allows '__newobj__' for the class of the object,
+    # which is not the public one for slot layouts.
+    cls = type(self)
+    get, set, own_reduce = _state_functions(cls)
+    if own_reduce:
+        return self.__reduce__()
+    public = public_class(cls)
+    return (copy_reg.__newobj__ if public is cls else _new_instance,
+            (public,), get(self))
+
+def _copy(self):
+    cls = type(self)
+    get, set, own_reduce = _state_functions(cls)
+    if own_reduce:
+        return copy._reconstruct(self, self.__reduce__(), False)
+    new = cls.__new__(cls)
+    set(new, get(self))
+    return new
+
+def _deepcopy(self, memo):
+    cls = type(self)
+    get, set, own_reduce = _state_functions(cls)
+    if own_reduce:
+        return copy._reconstruct(self, self.__reduce__(), True, memo)
+    new = memo[id(self)] = cls.__new__(cls)
+    set(new, deepcopy(get(self), memo))
+    return new
+
+def install_state_protocol(cls):
+    """
+    Makes pickle and copy save and restore the instances of 'cls' as
+    the tuple of their 'cooperative_state', unless 'cls' already
+    defines how or, for its subclasses, they do.
+    """
+    if not hasattr(cls, '__getstate__'):
+        cls.__getstate__  = _getstate
+        cls.__setstate__  = _setstate
+        cls.__reduce_ex__ = _reduce_ex
+        cls.__copy__      = _copy
+        cls.__deepcopy__  = _deepcopy
+
+def cooperative_class(cls):
+    validate_with_manifest(cls)
+    if not is_validated(cls):
+        check_cooperative_bases(cls)
+    cls.__abstractmethods__ = frozenset(get_abstract_methods(cls))
     cls._cooperative_is_coop = True
+    if '__cooperative_slots__' in cls.__dict__ and \
+       getattr(cls, '__new__') is not _new_with_slots:
+        cls.__new__ = staticmethod(_new_with_slots)
+    if '__cooperative_state__' in cls.__dict__ or \
+       '__cooperative_slots__' in cls.__dict__:
+        install_state_protocol(cls)
+    # The classes in the manifest are known to finalize fine, the rest
+    # are finalized when instantiated only when they use the metaclass
+    if is_validated(cls) or lazy_finalization and (
+            isinstance(cls, CooperativeMeta) or
+            not hides_cooperative_methods(cls)):
+        _pending_classes[cls] = True
+        # Only programs with pending classes pay for the check
+        if '__call__' not in CooperativeMeta.__dict__:
+            CooperativeMeta.__call__ = _finalizing_call
+    else:
+        for base in cls.__bases__:
+            finalize_class(base)
+        decorate_cooperative_class(cls)
     return cls
 
 class CooperativeMeta(type):
+    def __new__(meta, name, bases, dct):
+        # The actual slots are in the class from 'slot_layout'
+        if '__cooperative_slots__' in dct:
+            dct.setdefault('__slots__', ())
+        return super(CooperativeMeta, meta).__new__(meta, name, bases, dct)
+
     def __init__(cls, name, bases, dct):
         super(CooperativeMeta, cls).__init__(name, bases, dct)
         cooperative_class(cls)
 
 class Cooperative(object):
     __metaclass__ = CooperativeMeta
+
+    create_many = classmethod(create_many)
+
+class SlottedCooperative(object):
+    """
+    Like 'Cooperative', but it gives its instances no '__dict__', for
+    the roots of hierarchies with '__cooperative_slots__'.
+    """
+    __metaclass__ = CooperativeMeta
+    __slots__     = ()
+
+    create_many = classmethod(create_many)
+
+
+compose_cache_size    = 64
+_compositions         = {}
+_recent_compositions  = deque(maxlen=compose_cache_size)
+_compositions_lock    = threading.RLock()
+
+def set_compose_cache_size(size):
+    """ Sets how many of the last composed classes are kept alive. """
+    global compose_cache_size, _recent_compositions
+    with _compositions_lock:
+        compose_cache_size   = size
+        _recent_compositions = deque(_recent_compositions, maxlen=size)
+
+def compose(*mixins, **options):
+    """
+    Returns a cooperative class that inherits from the 'mixins', in
+    that order, with the given 'name', 'module' and 'metaclass'
+    options.  The same class is returned for the same mixins and
+    options while it is alive, with its dispatch plans and runners,
+    and the last 'compose_cache_size' composed classes are kept alive.
+    Unlike creating the class with 'type', this is cheap enough to
+    do on every call.
+    """
+    # Mixins are classes, so a key without options can not be mistaken
+    # for one with them
+    key = (mixins, tuple(sorted(options.iteritems()))) if options else mixins
+    try:
+        cls = _compositions[key]()
+        if cls is not None:
+            return cls
+    except KeyError:
+        pass
+    except TypeError:
+        raise TypeError("compose() options must be hashable")
+    unknown = set(options) - set(('name', 'module', 'metaclass'))
+    if unknown:
+        raise TypeError("compose() got unexpected keyword arguments: " +
+                        ', '.join(sorted(unknown)))
+    if not mixins:
+        raise TypeError("compose() takes at least one class")
+
+    with _compositions_lock:
+        ref = _compositions.get(key)
+        cls = ref and ref()
+        if cls is None:
+            name = options.get('name') or \
+                   '_'.join(mixin.__name__ for mixin in mixins)
+            meta = options.get('metaclass') or type
+            cls  = meta(name, mixins, {
+                '__module__': options.get('module') or mixins[0].__module__ })
+            if not isinstance(cls, CooperativeMeta):
+                cls = cooperative_class(cls)
+            def forget(ref):
+                with _compositions_lock:
+                    if _compositions.get(key) is ref:
+                        del _compositions[key]
+            _compositions[key] = weakref.ref(cls, forget)
+            _recent_compositions.append(cls)
+    return cls
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+#  File:       validate.py
+#  Author:     Juan Pedro Bolívar Puente <raskolnikov@es.gnu.org>
+#
+
+#
+#  Copyright (c) 2012, 2015 Juan Pedro Bolivar Puente <raskolnikov@gnu.org>
+#
+#  Permission is hereby granted, free of charge, to any person
+#  obtaining a copy of this software and associated documentation
+#  files (the "Software"), to deal in the Software without
+#  restriction, including without limitation the rights to use, copy,
+#  modify, merge, publish, distribute, sublicense, and/or sell copies
+#  of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be
+#  included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+#  NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+#  BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+#  ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+#  CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+
+"""
+Imports some packages, checks all their cooperative classes and
+writes a manifest of them.  When 'COOPER_MANIFEST' points to it, the
+classes that did not change since skip the checks on import.
+"""
+
+from . import cooper
+import argparse
+import gc
+import importlib
+import json
+import pkgutil
+import platform
+import sys
+import traceback
+
+
+def import_all(name):
+    """
+    Imports the module 'name' and, if it is a package, all its
+    submodules.  Returns the number of them that failed.
+    """
+    failed = []
+    def onerror(name):
+        traceback.print_exc()
+        failed.append(name)
+    try:
+        module = importlib.import_module(name)
+    except Exception:
+        onerror(name)
+    else:
+        if hasattr(module, '__path__'):
+            for _, sub, _ in pkgutil.walk_packages(
+                    module.__path__, name + '.', onerror):
+                try:
+                    importlib.import_module(sub)
+                except Exception:
+                    onerror(sub)
+    return len(failed)
+
+def cooperative_classes(packages):
+    """
+    Returns the cooperative classes in 'packages' that were hashed,
+    but not the hidden ones for the slots.
+    """
+    # Drops the classes of failed imports
+    gc.collect()
+    classes = []
+    seen    = set()
+    pending = [object]
+    while pending:
+        for cls in type.__subclasses__(pending.pop()):
+            if cls not in seen:
+                seen.add(cls)
+                pending.append(cls)
+                if '_cooperative_hash' in cls.__dict__ and \
+                   cls.__dict__.get('_cooperative_layout') is not cls and \
+                   any(cls.__module__ == p or
+                       cls.__module__.startswith(p + '.')
+                       for p in packages):
+                    classes.append(cls)
+    return classes
+
+def make_manifest(classes):
+    manifest = {}
+    for cls in classes:
+        hashes = manifest.setdefault(cls.__module__, {}) \
+                         .setdefault(cls.__name__, [])
+        if cls._cooperative_hash not in hashes:
+            hashes.append(cls._cooperative_hash)
+            hashes.sort()
+    return manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('packages', nargs='+',
+                        help='packages or modules to check')
+    parser.add_argument('-o', '--output', default='cooper-manifest.json',
+                        help='manifest file (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    # Everything has to be checked and hashed
+    cooper.set_release_mode(False)
+    cooper.set_validation_manifest({})
+
+    failures = sum(map(import_all, args.packages))
+    for cls in cooper._pending_classes.keys():
+        try:
+            cooper.finalize_class(cls)
+        except Exception:
+            traceback.print_exc()
+            failures += 1
+    if failures:
+        print '%d modules or classes failed, no manifest written' % failures
+        return 1
+
+    classes = cooperative_classes(args.packages)
+    with open(args.output, 'w') as f:
+        json.dump({ 'python':  platform.python_version(),
+                    'classes': make_manifest(classes) },
+                  f, indent=2, sort_keys=True, separators=(',', ': '))
+        f.write('\n')
+    print 'Checked %d cooperative classes, wrote %s' % (
+        len(classes), args.output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Runs the benchmarks in 'bench' and compares them with a baseline.
+
+The exit status is non zero when the ratio of some benchmark grows
+over the baseline more than the threshold, or when it leaves more
+objects alive or allocates more of them than the baseline.  Use
+'--save' to store the results as the new baseline.
+"""
+
+from bench.bnc_cooper import benchmarks, measure
+import argparse
+import json
+import os
+import platform
+import sys
+
+default_baseline = os.path.join(os.path.dirname(__file__),
+                                'bench', 'baseline.json')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('names', nargs='*',
+                        help='run only benchmarks containing these')
+    parser.add_argument('--baseline', default=default_baseline,
+                        help='baseline file (default: %(default)s)')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed relative growth of the ratios '
+                        '(default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=30,
+                        help='measures per benchmark (default: %(default)s)')
+    parser.add_argument('--save', action='store_true',
+                        help='store the results as the new baseline')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    results  = {}
+    failures = []
+    print '%-28s %10s %10s %7s %9s %8s %9s' % (
+        'benchmark', 'manual', 'coop', 'ratio', 'baseline', 'retained',
+        'allocated')
+    for name, setup, number in benchmarks:
+        if args.names and not any(n in name for n in args.names):
+            continue
+        result = results[name] = measure(setup, number, args.repeat)
+        old    = baseline.get(name)
+        status = ''
+        if old and not args.save:
+            if result['ratio'] > old['ratio'] * (1 + args.threshold):
+                status = ' SLOWER'
+            if result['retained'] > old['retained']:
+                status += ' LEAKS'
+            # Allocations may be off by a fraction of an object
+            if result['allocated'] >= old.get('allocated', float('inf')) + 1:
+                status += ' ALLOCATES'
+            if status:
+                failures.append(name)
+        print '%-28s %8.2fus %8.2fus %7.2f %9s %8d %9.2f%s' % (
+            name, result['manual'] * 1e6, result['coop'] * 1e6,
+            result['ratio'], '%.2f' % old['ratio'] if old else '-',
+            result['retained'], result['allocated'], status)
+
+    if args.save:
+        if args.names:
+            baseline.update(results)
+            results = baseline
+        with open(args.baseline, 'w') as f:
+            json.dump({ 'python':  platform.python_version(),
+                        'results': results },
+                      f, indent=2, sort_keys=True, separators=(',', ': '))
+            f.write('\n')
+        print 'Saved baseline to', args.baseline
+    elif failures:
+        print '%d benchmarks regressed over %d%%: %s' % (
+            len(failures), args.threshold * 100, ', '.join(failures))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -34,6 +34,9 @@ Tests for cooper.
 """
 
 import cooper
+import os
+import sys
+from functools import wraps
 from itertools import repeat
 
 import unittest
@@ -111,6 +114,16 @@ def make_test_hierarchy(trace, decorator=lambda x:x, metacls=type):
     return _A, _B, _C, _D, _F
 
 
+def checked(test):
+    """ Skips 'test' in release mode, where the checks are stripped. """
+    @wraps(test)
+    def wrapper(self):
+        if cooper.get_release_mode():
+            self.skipTest("checks are stripped in release mode")
+        return test(self)
+    return wrapper
+
+
 class TestCoop(unittest.TestCase):
 
     cls_decorator = cooper.cooperative_class
@@ -123,6 +136,9 @@ class TestCoop(unittest.TestCase):
             decorator = self.cls_decorator.im_func,
             metacls   = self.cls_meta)
 
+    def assertClassFails(self, exc, make_cls):
+        self.assertRaises(exc, make_cls)
+
     def test_init_parameter_passing(self):
         obj = self._D()
         self.assertEqual(obj._b_param, 'b_param')
@@ -138,6 +154,7 @@ class TestCoop(unittest.TestCase):
         self.assertEqual(obj._b_param, 'new_b_param')
         self.assertEqual(obj._d_param, 'new_d_param')
 
+    @checked
     def test_init_check_no_positional(self):
         def make_cls():
             @self.cls_decorator.im_func
@@ -146,8 +163,9 @@ class TestCoop(unittest.TestCase):
                 @cooper.cooperate
                 def __init__(self, positional):
                     pass
-        self.assertRaises (cooper.CooperativeError, make_cls)
+        self.assertClassFails(cooper.CooperativeError, make_cls)
 
+    @checked
     def test_init_check_no_variadic(self):
         def make_cls():
             @self.cls_decorator.im_func
@@ -156,8 +174,9 @@ class TestCoop(unittest.TestCase):
                 @cooper.cooperate
                 def __init__(self, *a):
                     pass
-        self.assertRaises (cooper.CooperativeError, make_cls)
+        self.assertClassFails(cooper.CooperativeError, make_cls)
 
+    @checked
     def test_init_check_no_variadic_keywords(self):
         def make_cls():
             @self.cls_decorator.im_func
@@ -166,7 +185,100 @@ class TestCoop(unittest.TestCase):
                 @cooper.cooperate
                 def __init__(self, **k):
                     pass
-        self.assertRaises (cooper.CooperativeError, make_cls)
+        self.assertClassFails(cooper.CooperativeError, make_cls)
+
+    @checked
+    def test_del_check_no_params(self):
+        def make_cls():
+            @self.cls_decorator.im_func
+            class _Bad(object):
+                __metaclass__ = self.cls_meta
+                @cooper.cooperate
+                def __del__(self, param=None):
+                    pass
+        self.assertClassFails(cooper.CooperativeError, make_cls)
+
+    def test_del_cooperates(self):
+        outer_self = self
+        @self.cls_decorator.im_func
+        class _Del(self._D):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperate
+            def __del__(self):
+                outer_self._trace.append(_Del.__del__)
+        @self.cls_decorator.im_func
+        class _Del2(_Del):
+            __metaclass__ = self.cls_meta
+            @cooper.post_cooperate
+            def __del__(self):
+                outer_self._trace.append(_Del2.__del__)
+        obj = _Del2()
+        self._clear_trace()
+        del obj
+        self.assertEqual([m.im_class for m in self._trace], [_Del2, _Del])
+
+    def test_method_signature_is_computed_once(self):
+        def method(self, a, b, c=1, d=2, *args, **kws):
+            pass
+        sig = cooper.method_signature(method)
+        self.assertTrue(cooper.method_signature(method) is sig)
+        self.assertEqual(sig.positional, ('a', 'b'))
+        self.assertEqual(sig.keywords, ('c', 'd'))
+        self.assertEqual(sig.defaults, (1, 2))
+        self.assertEqual(sig.varargs, 'args')
+        self.assertEqual(sig.varkw, 'kws')
+        self.assertEqual(sig.names, ('a', 'b', 'c', 'd'))
+
+    def test_generator_can_not_cooperate(self):
+        @self.cls_decorator.im_func
+        class _Root(object):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperative
+            def method(self, mparam):
+                yield mparam
+        def make_cls():
+            @self.cls_decorator.im_func
+            class _Bad(_Root):
+                __metaclass__ = self.cls_meta
+                @cooper.cooperate
+                def method(self, mparam):
+                    yield mparam
+        self.assertClassFails(cooper.CooperativeError, make_cls)
+
+    def test_plain_method_can_not_cooperate_over_generator(self):
+        @self.cls_decorator.im_func
+        class _Root(object):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperative
+            def run(self):
+                yield 1
+        def make_cls():
+            @self.cls_decorator.im_func
+            class _Bad(_Root):
+                __metaclass__ = self.cls_meta
+                @cooper.cooperate
+                def run(self):
+                    return [2]
+        self.assertClassFails(cooper.CooperativeError, make_cls)
+
+    def test_generator_can_not_inner_cooperate(self):
+        def make_cls():
+            @self.cls_decorator.im_func
+            class _Bad(self._A):
+                __metaclass__ = self.cls_meta
+                @cooper.inner_cooperate
+                def method(self, next_method, mparam):
+                    yield next_method(mparam)
+        self.assertClassFails(cooper.CooperativeError, make_cls)
+
+    def test_generator_can_cooperate_over_plain_method(self):
+        @self.cls_decorator.im_func
+        class _Gen(self._A):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperate
+            def method(self, mparam):
+                yield mparam
+        self.assertEqual(list(_Gen().method(1)), [1])
 
     def test_init_must_cooperate(self):
         def make_cls():
@@ -175,7 +287,7 @@ class TestCoop(unittest.TestCase):
                 __metaclass__ = self.cls_meta
                 def __init__(self):
                     pass
-        self.assertRaises (cooper.CooperativeError, make_cls)
+        self.assertClassFails(cooper.CooperativeError, make_cls)
 
     def test_init_must_override(self):
         def make_cls():
@@ -185,7 +297,7 @@ class TestCoop(unittest.TestCase):
                 @cooper.cooperative
                 def __init__(self):
                     pass
-        self.assertRaises (cooper.CooperativeError, make_cls)
+        self.assertClassFails(cooper.CooperativeError, make_cls)
 
     def test_super_params_sends_params(self):
         @self.cls_decorator.im_func
@@ -197,6 +309,73 @@ class TestCoop(unittest.TestCase):
         obj = _Fixed()
         self.assertEqual(obj._b_param, 'fixed_b_param')
 
+    def test_super_params_are_routed_statically(self):
+        @self.cls_decorator.im_func
+        class _Fixed(self._F):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperate_with_params(b_param='fixed_b_param')
+            def __init__(self):
+                pass
+        plan = cooper.dispatch_plan(_Fixed, '__init__')
+        routing = cooper.KeywordRouting(plan)
+        self.assertEqual(routing.table, {'d_param': 1,
+                                         'b_param': cooper.DROP_KEYWORD})
+        self.assertEqual(routing.fixed, {2: {'b_param': 'fixed_b_param'}})
+        source, _ = cooper.make_plan_source(plan)
+        self.assertFalse('for ' in source)
+        obj = _Fixed(b_param='ignored')
+        self.assertEqual(obj._b_param, 'fixed_b_param')
+
+    def test_super_params_that_are_not_literals(self):
+        import math
+        @self.cls_decorator.im_func
+        class _Root(object):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperate
+            def __init__(self, x=None, y=None):
+                self.x, self.y = x, y
+            @cooper.cooperative
+            def method(self, **k):
+                return k
+        @self.cls_decorator.im_func
+        class _Fixed(_Root):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperate_with_params(x=float('-inf'), y=float('nan'))
+            def __init__(self):
+                pass
+            @cooper.post_cooperate_with_params(
+                **{ 'a-b': float('inf'), 'c': 0.5 })
+            def method(self):
+                pass
+        for obj in [_Fixed()] + list(cooper.create_many(_Fixed, [{}])):
+            self.assertEqual(obj.x, float('-inf'))
+            self.assertTrue(math.isnan(obj.y))
+        self.assertEqual(_Fixed().method(),
+                         { 'a-b': float('inf'), 'c': 0.5 })
+
+    def test_init_unknown_keyword_fails_before_any_override(self):
+        self._clear_trace()
+        self.assertRaises(cooper.CooperativeError, self._D,
+                          b_param='b', misspelled_param='oops')
+        self.assertEqual(self._trace, [])
+
+    def test_init_unknown_fixed_keyword_fails_before_any_override(self):
+        @self.cls_decorator.im_func
+        class _Fixed(self._F):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperate_with_params(misspelled_param='oops')
+            def __init__(self):
+                pass
+        self._clear_trace()
+        self.assertRaises(cooper.CooperativeError, _Fixed)
+        self.assertEqual(self._trace, [])
+
+    def test_init_keywords_are_routed_to_first_picker(self):
+        routing = cooper.KeywordRouting(
+            cooper.dispatch_plan(self._D, '__init__'))
+        self.assertEqual(routing.table, {'d_param': 0, 'b_param': 1})
+        self.assertEqual(routing.accepted, frozenset())
+
     def test_manual_init(self):
         outer_self = self
         @self.cls_decorator.im_func
@@ -304,7 +483,55 @@ class TestCoop(unittest.TestCase):
                 @cooper.cooperate
                 def method(self):
                     pass
-        self.assertRaises(cooper.CooperativeError, make_class)
+        self.assertClassFails(cooper.CooperativeError, make_class)
+
+    def test_conflict_in_bases_is_indexed(self):
+        @self.cls_decorator.im_func
+        class _A1(object):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperative
+            def method(self):
+                pass
+        @self.cls_decorator.im_func
+        class _A2(object):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperative
+            def method(self):
+                pass
+        @self.cls_decorator.im_func
+        class _A12(_A1, _A2):
+            __metaclass__ = self.cls_meta
+        self.assertEqual(cooper.cooperative_roots(_A12)['method'],
+                         (_A1, _A2))
+        def make_class():
+            @self.cls_decorator.im_func
+            class _Deriv(_A12):
+                __metaclass__ = self.cls_meta
+                @cooper.cooperate
+                def method(self):
+                    pass
+        self.assertClassFails(cooper.CooperativeError, make_class)
+
+    def test_cooperative_roots_index(self):
+        roots = cooper.cooperative_roots(self._F)
+        self.assertEqual(roots['method'], (self._A,))
+        self.assertEqual(roots['post_method'], (self._A,))
+        self.assertTrue(cooper.cooperative_roots(self._B) is
+                        cooper.cooperative_roots(self._A))
+
+    def test_override_through_class_that_does_not(self):
+        @self.cls_decorator.im_func
+        class _Middle(self._A):
+            __metaclass__ = self.cls_meta
+        @self.cls_decorator.im_func
+        class _Deriv(_Middle):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperate
+            def method(self, mparam):
+                pass
+        self.assertEqual([s.owner for s in
+                          cooper.dispatch_plan(_Deriv, 'method').steps],
+                         [_Deriv])
 
     def test_mro_call_order(self):
         for cls in (self._D, self._C, self._B, self._A):
@@ -346,6 +573,7 @@ class TestCoop(unittest.TestCase):
         self._check_trace_calls_with_mro(_Cls.method)
         self.assertEqual(obj._b_mparam, 'new_b_mparam')
 
+    @checked
     def test_inner_error_call_too_much(self):
         @self.cls_decorator.im_func
         class _Cls(self._D):
@@ -357,6 +585,7 @@ class TestCoop(unittest.TestCase):
         obj = _Cls()
         self.assertRaises(cooper.CooperativeError, obj.method, 1)
 
+    @checked
     def test_inner_error_not_call(self):
         @self.cls_decorator.im_func
         class _Cls(self._D):
@@ -367,6 +596,1186 @@ class TestCoop(unittest.TestCase):
         obj = _Cls()
         self.assertRaises(cooper.CooperativeError, obj.method, 1)
 
+    def test_inner_next_method_skip(self):
+        outer_self = self
+        @self.cls_decorator.im_func
+        class _Cls(self._D):
+            __metaclass__ = self.cls_meta
+            @cooper.inner_cooperate
+            def method(self, next_method, param):
+                if param:
+                    next_method.skip()
+                else:
+                    next_method()
+                outer_self._trace.append(_Cls.method)
+        obj = _Cls()
+        self._clear_trace()
+        obj.method(1)
+        self.assertEqual(self._trace, [_Cls.method])
+        self._clear_trace()
+        obj.method(0)
+        self._check_trace_calls_with_mro(_Cls.method)
+
+    @checked
+    def test_inner_error_skip_after_call(self):
+        @self.cls_decorator.im_func
+        class _Cls(self._D):
+            __metaclass__ = self.cls_meta
+            @cooper.inner_cooperate
+            def method(self, next_method, param):
+                next_method()
+                next_method.skip()
+        self.assertRaises(cooper.CooperativeError, _Cls().method, 1)
+
+    def _make_short_hierarchy(self, log):
+        @self.cls_decorator.im_func
+        class _Widget(object):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperative
+            def on_key(self, key, **k):
+                log.append(_Widget)
+                return 'widget'
+        @self.cls_decorator.im_func
+        class _Text(_Widget):
+            __metaclass__ = self.cls_meta
+            @cooper.short_cooperate
+            def on_key(self, key, editable=True):
+                log.append(_Text)
+                if key.isalpha() and editable:
+                    return 'text'
+        @self.cls_decorator.im_func
+        class _Entry(_Text):
+            __metaclass__ = self.cls_meta
+            @cooper.short_cooperate
+            def on_key(self, key):
+                log.append(_Entry)
+                if key == '\n':
+                    return False
+        return _Widget, _Text, _Entry
+
+    def test_short_cooperate(self):
+        log = []
+        _Widget, _Text, _Entry = self._make_short_hierarchy(log)
+        obj = _Entry()
+        self.assertEqual(obj.on_key('\n'), False)
+        self.assertEqual(log, [_Entry])
+        del log[:]
+        self.assertEqual(obj.on_key('a'), 'text')
+        self.assertEqual(log, [_Entry, _Text])
+        del log[:]
+        self.assertEqual(obj.on_key('a', editable=False), 'widget')
+        self.assertEqual(log, [_Entry, _Text, _Widget])
+        self.assertEqual(cooper.call_all([obj, obj, _Text()], 'on_key', '\n'),
+                         [False, False, 'widget'])
+
+    def test_short_cooperate_can_not_mix(self):
+        _Widget, _Text, _Entry = self._make_short_hierarchy([])
+        def make_cls():
+            @self.cls_decorator.im_func
+            class _Mixed(_Entry):
+                __metaclass__ = self.cls_meta
+                @cooper.post_cooperate
+                def on_key(self, key):
+                    pass
+        self.assertClassFails(cooper.CooperativeError, make_cls)
+
+    def _make_cached_hierarchy(self, log, **options):
+        cached = cooper.cached_cooperate(cooper.extend_cooperate, **options)
+        @self.cls_decorator.im_func
+        class _Base(object):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperative
+            def caps(self, *a, **k):
+                log.append(_Base)
+                return ['base']
+        @self.cls_decorator.im_func
+        class _Mid(_Base):
+            __metaclass__ = self.cls_meta
+            extra = []
+            @cached
+            def caps(self, *a):
+                log.append(_Mid)
+                return self.extra
+            def add(self, cap):
+                self.extra = self.extra + [cap]
+                cooper.invalidate_cache(self, 'caps')
+        @self.cls_decorator.im_func
+        class _Leaf(_Mid):
+            __metaclass__ = self.cls_meta
+            @cached
+            def caps(self, *a):
+                log.append(_Leaf)
+                return ['leaf']
+        return _Base, _Mid, _Leaf
+
+    def test_cached_cooperate(self):
+        log = []
+        _Base, _Mid, _Leaf = self._make_cached_hierarchy(log)
+        obj = _Leaf()
+        self.assertEqual(obj.caps(), ['base', 'leaf'])
+        self.assertEqual(obj.caps(), ['base', 'leaf'])
+        self.assertEqual(log, [_Base, _Mid, _Leaf])
+        self.assertEqual(obj.caps(1), ['base', 'leaf'])
+        self.assertEqual(len(log), 6)
+        self.assertEqual(_Leaf().caps(), ['base', 'leaf'])
+        self.assertEqual(len(log), 9)
+        del log[:]
+        obj.add('mid')
+        self.assertEqual(obj.caps(), ['base', 'mid', 'leaf'])
+        self.assertEqual(obj.caps(1), ['base', 'mid', 'leaf'])
+        self.assertEqual(log, [_Base, _Mid, _Leaf] * 2)
+
+    def test_cached_cooperate_keywords_and_unhashable(self):
+        log = []
+        _Base, _Mid, _Leaf = self._make_cached_hierarchy(log)
+        obj = _Leaf()
+        obj.caps(extra=1)
+        obj.caps(extra=1)
+        self.assertEqual(len(log), 3)
+        obj.caps(extra=2)
+        obj.caps([])
+        obj.caps([])
+        self.assertEqual(len(log), 12)
+
+    def test_cached_cooperate_evicts_oldest(self):
+        log = []
+        _Base, _Mid, _Leaf = self._make_cached_hierarchy(log, maxsize=2)
+        obj = _Leaf()
+        for arg in (1, 2, 3, 2, 1):
+            obj.caps(arg)
+        self.assertEqual(len(log), 4 * 3)
+
+    def test_cached_cooperate_per_class(self):
+        log = []
+        _Base, _Mid, _Leaf = self._make_cached_hierarchy(
+            log, per_class=True)
+        self.assertEqual(_Leaf().caps(), ['base', 'leaf'])
+        self.assertEqual(_Leaf().caps(), ['base', 'leaf'])
+        self.assertEqual(len(log), 3)
+        _Mid.extra = ['mid']
+        cooper.invalidate_cache(_Mid)
+        self.assertEqual(_Leaf().caps(), ['base', 'mid', 'leaf'])
+        self.assertEqual(len(log), 6)
+
+    def test_cached_cooperate_forgets_dead_instances(self):
+        _Base, _Mid, _Leaf = self._make_cached_hierarchy([])
+        before = len(cooper.cooper._instance_caches)
+        obj = _Leaf()
+        obj.caps()
+        self.assertEqual(len(cooper.cooper._instance_caches), before + 1)
+        del obj
+        self.assertEqual(len(cooper.cooper._instance_caches), before)
+
+    def test_cached_cooperate_with_manual_override(self):
+        _Base, _Mid, _Leaf = self._make_cached_hierarchy([])
+        @self.cls_decorator.im_func
+        class _Manual(_Leaf):
+            __metaclass__ = self.cls_meta
+            @cooper.manual_cooperate
+            def caps(self, *a):
+                return super(_Manual, self).caps(*a) + ['manual']
+        @self.cls_decorator.im_func
+        class _Deriv(_Manual):
+            __metaclass__ = self.cls_meta
+            @cooper.cached_cooperate(cooper.extend_cooperate)
+            def caps(self, *a):
+                return ['deriv']
+        obj = _Deriv()
+        self.assertEqual(obj.caps(), ['base', 'leaf', 'manual', 'deriv'])
+        self.assertEqual(obj.caps(), ['base', 'leaf', 'manual', 'deriv'])
+
+    def test_cached_cooperate_without_weakref(self):
+        log = []
+        @self.cls_decorator.im_func
+        class _Base(object):
+            __metaclass__ = self.cls_meta
+            __slots__ = ()
+            @cooper.cooperative
+            def caps(self):
+                return ['base']
+        @self.cls_decorator.im_func
+        class _Leaf(_Base):
+            __metaclass__ = self.cls_meta
+            __slots__ = ()
+            @cooper.cached_cooperate(cooper.extend_cooperate)
+            def caps(self):
+                log.append(_Leaf)
+                return ['leaf']
+        obj = _Leaf()
+        self.assertEqual(obj.caps(), ['base', 'leaf'])
+        self.assertEqual(obj.caps(), ['base', 'leaf'])
+        self.assertEqual(log, [_Leaf, _Leaf])
+
+    def test_cached_cooperate_can_not_mix(self):
+        _Base, _Mid, _Leaf = self._make_cached_hierarchy([])
+        def make_cls():
+            @self.cls_decorator.im_func
+            class _Mixed(_Leaf):
+                __metaclass__ = self.cls_meta
+                @cooper.extend_cooperate
+                def caps(self):
+                    return []
+        self.assertClassFails(cooper.CooperativeError, make_cls)
+
+    def test_compose(self):
+        _Cls = cooper.compose(self._B, self._C)
+        self.assertTrue(cooper.compose(self._B, self._C) is _Cls)
+        self.assertEqual(_Cls.__bases__, (self._B, self._C))
+        self.assertEqual(_Cls.__name__, '_B__C')
+        self.assertEqual(_Cls.__module__, self._B.__module__)
+        obj = _Cls()
+        self._clear_trace()
+        obj.method(1)
+        self.assertEqual([m.im_class for m in self._trace],
+                         [self._A, self._C, self._B])
+        self.assertFalse(cooper.compose(self._C, self._B) is _Cls)
+        self.assertEqual(cooper.compose(self._C, self._B)().method(1), None)
+
+    def test_compose_options(self):
+        _Cls = cooper.compose(self._B, self._C, name='_BC', module='mod')
+        self.assertEqual((_Cls.__name__, _Cls.__module__), ('_BC', 'mod'))
+        self.assertTrue(
+            cooper.compose(self._B, self._C, module='mod', name='_BC') is _Cls)
+        self.assertFalse(cooper.compose(self._B, self._C) is _Cls)
+        self.assertRaises(TypeError, cooper.compose, self._B, bases=())
+        self.assertRaises(TypeError, cooper.compose)
+
+    def test_compose_keeps_only_recent_classes(self):
+        import gc
+        import weakref
+        old_size = cooper.compose_cache_size
+        cooper.set_compose_cache_size(1)
+        try:
+            first = cooper.compose(self._B, self._C)
+            first().method(1)
+            cooper.call_all([first()], 'method', 1)
+            first = weakref.ref(first)
+            gc.collect()
+            self.assertTrue(first() is not None)
+            cooper.compose(self._C, self._B)().method(1)
+            gc.collect()
+            self.assertTrue(first() is None)
+        finally:
+            cooper.set_compose_cache_size(old_size)
+
+    def test_inner_next_method_returns_result(self):
+        @self.cls_decorator.im_func
+        class _Root(object):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperative
+            def method(self, param):
+                return param * 2
+        @self.cls_decorator.im_func
+        class _Cls(_Root):
+            __metaclass__ = self.cls_meta
+            @cooper.inner_cooperate
+            def method(self, next_method, param):
+                return next_method() + 1
+        self.assertEqual(_Cls().method(2), 5)
+
+    def test_inner_next_method_is_reused(self):
+        next_methods = []
+        @self.cls_decorator.im_func
+        class _Cls(self._D):
+            __metaclass__ = self.cls_meta
+            @cooper.inner_cooperate
+            def method(self, next_method, param):
+                next_methods.append(next_method)
+                if param:
+                    self.method(param - 1)
+                next_method()
+        obj = _Cls()
+        obj.method(0)
+        obj.method(0)
+        self.assertTrue(next_methods[0] is next_methods[1])
+        self.assertFalse(hasattr(next_methods[0], '__dict__'))
+        del next_methods[:]
+        obj.method(1)
+        self.assertFalse(next_methods[0] is next_methods[1])
+        if not cooper.get_release_mode():
+            self.assertRaises(cooper.CooperativeError, next_methods[0])
+
+    @checked
+    def test_inner_error_does_not_leak_into_next_call(self):
+        @self.cls_decorator.im_func
+        class _Cls(self._D):
+            __metaclass__ = self.cls_meta
+            @cooper.inner_cooperate
+            def method(self, next_method, param):
+                for _ in xrange(param):
+                    next_method()
+        obj = _Cls()
+        self.assertRaises(cooper.CooperativeError, obj.method, 2)
+        obj.method(1)
+
+    def test_inner_cooperate_is_reentrant_and_thread_safe(self):
+        import threading
+        @self.cls_decorator.im_func
+        class _Cls(self._D):
+            __metaclass__ = self.cls_meta
+            @cooper.inner_cooperate
+            def method(self, next_method, depth):
+                if depth > 0:
+                    _Cls().method(depth - 1)
+                next_method()
+                if depth > 0:
+                    _Cls().method(depth - 1)
+        errors = []
+        def run():
+            try:
+                for _ in xrange(20):
+                    _Cls().method(3)
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=run) for _ in xrange(8)]
+        old_interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            sys.setcheckinterval(old_interval)
+        self.assertEqual(errors, [])
+
+    def _make_parallel_hierarchy(self, body):
+        @self.cls_decorator.im_func
+        class _Root(object):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperative
+            def dispose(self):
+                return body(_Root)
+        @self.cls_decorator.im_func
+        class _Left(_Root):
+            __metaclass__ = self.cls_meta
+            @cooper.parallel_cooperate
+            def dispose(self):
+                return body(_Left)
+        @self.cls_decorator.im_func
+        class _Right(_Root):
+            __metaclass__ = self.cls_meta
+            @cooper.parallel_cooperate
+            def dispose(self):
+                return body(_Right)
+        @self.cls_decorator.im_func
+        class _Both(_Left, _Right):
+            __metaclass__ = self.cls_meta
+            @cooper.parallel_cooperate
+            def dispose(self):
+                return body(_Both)
+        return _Root, _Left, _Right, _Both
+
+    def test_parallel_cooperate_runs_concurrently(self):
+        import threading
+        lock = threading.Condition()
+        arrived = []
+        def body(cls):
+            import time
+            deadline = time.time() + 5
+            with lock:
+                arrived.append(cls)
+                lock.notify_all()
+                while len(arrived) < 4:
+                    if time.time() > deadline:
+                        raise AssertionError("Not concurrent")
+                    lock.wait(1)
+            return cls
+        _Root, _Left, _Right, _Both = self._make_parallel_hierarchy(body)
+        self.assertEqual(_Both().dispose(), _Both)
+        self.assertEqual(set(arrived), set([_Root, _Left, _Right, _Both]))
+
+    def test_parallel_cooperate_collects_errors(self):
+        def body(cls):
+            if cls.__name__ in ('_Left', '_Root'):
+                raise ValueError(cls.__name__)
+        _Root, _Left, _Right, _Both = self._make_parallel_hierarchy(body)
+        old_executor = cooper.parallel_executor
+        for executor in (cooper.SerialExecutor(), old_executor):
+            cooper.set_parallel_executor(executor)
+            try:
+                _Both().dispose()
+            except cooper.ParallelError as e:
+                self.assertEqual([(owner, exc.args) for owner, exc
+                                  in e.errors],
+                                 [(_Left, ('_Left',)), (_Root, ('_Root',))])
+            else:
+                self.fail("ParallelError not raised")
+            finally:
+                cooper.set_parallel_executor(old_executor)
+
+    def test_parallel_cooperate_nested(self):
+        import threading
+        lock  = threading.Lock()
+        outer = []
+        def body(cls):
+            # Two of them wait for a nested call, filling the pool
+            with lock:
+                nest = cls in (_Left, _Both) and len(outer) < 2
+                if nest:
+                    outer.append(cls)
+            return _Both().dispose() if nest else cls
+        _Root, _Left, _Right, _Both = self._make_parallel_hierarchy(body)
+        results = []
+        old_executor = cooper.parallel_executor
+        cooper.set_parallel_executor(cooper.ThreadPoolExecutor(2))
+        try:
+            thread = threading.Thread(
+                target=lambda: results.append(_Both().dispose()))
+            thread.daemon = True
+            thread.start()
+            thread.join(5)
+        finally:
+            cooper.set_parallel_executor(old_executor)
+        self.assertEqual(results, [_Both])
+
+    def test_parallel_cooperate_can_not_mix(self):
+        _Root, _Left, _Right, _Both = self._make_parallel_hierarchy(
+            lambda cls: None)
+        def make_cls():
+            @self.cls_decorator.im_func
+            class _Mixed(_Both):
+                __metaclass__ = self.cls_meta
+                @cooper.cooperate
+                def dispose(self):
+                    pass
+        self.assertClassFails(cooper.CooperativeError, make_cls)
+        @self.cls_decorator.im_func
+        class _Plain(_Root):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperate
+            def dispose(self):
+                pass
+        def make_diamond():
+            @self.cls_decorator.im_func
+            class _Diamond(_Left, _Plain):
+                __metaclass__ = self.cls_meta
+        self.assertClassFails(cooper.CooperativeError, make_diamond)
+
+    def _make_reduce_hierarchy(self, decorator, value):
+        @self.cls_decorator.im_func
+        class _Root(object):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperative
+            def collect(self, **k):
+                return value('root')
+        @self.cls_decorator.im_func
+        class _Left(_Root):
+            __metaclass__ = self.cls_meta
+            @decorator
+            def collect(self, left=0):
+                return value('left')
+        @self.cls_decorator.im_func
+        class _Right(_Root):
+            __metaclass__ = self.cls_meta
+            @decorator
+            def collect(self):
+                return value('right')
+        @self.cls_decorator.im_func
+        class _Both(_Left, _Right):
+            __metaclass__ = self.cls_meta
+            @decorator
+            def collect(self):
+                return value('both')
+        return _Both
+
+    def test_extend_cooperate(self):
+        _Both = self._make_reduce_hierarchy(
+            cooper.extend_cooperate, lambda name: [name])
+        self.assertEqual(_Both().collect(left=1),
+                         ['root', 'right', 'left', 'both'])
+        self.assertEqual(cooper.call_all([_Both(), _Both()], 'collect'),
+                         [['root', 'right', 'left', 'both']] * 2)
+
+    def test_extend_cooperate_gets_a_new_list_every_call(self):
+        _Both = self._make_reduce_hierarchy(
+            cooper.extend_cooperate, lambda name: (name,))
+        obj = _Both()
+        first = obj.collect()
+        self.assertEqual(first, ['root', 'right', 'left', 'both'])
+        self.assertFalse(first is obj.collect())
+
+    def test_merge_cooperate_derived_wins(self):
+        _Both = self._make_reduce_hierarchy(
+            cooper.merge_cooperate,
+            lambda name: { 'last': name, name: True })
+        self.assertEqual(_Both().collect(),
+                         { 'last': 'both', 'root': True, 'left': True,
+                           'right': True, 'both': True })
+
+    def test_sum_all_any_cooperate(self):
+        lengths = self._make_reduce_hierarchy(cooper.sum_cooperate, len)
+        self.assertEqual(lengths().collect(), 4 + 5 + 4 + 4)
+        long_names = lambda name: len(name) > 4
+        self.assertFalse(self._make_reduce_hierarchy(
+            cooper.all_cooperate, long_names)().collect())
+        self.assertTrue(self._make_reduce_hierarchy(
+            cooper.any_cooperate, long_names)().collect())
+
+    def test_reduce_cooperate_custom(self):
+        joined = cooper.reduce_cooperate(lambda acc, x: acc + '/' + x, '')
+        _Both = self._make_reduce_hierarchy(joined, lambda name: name)
+        self.assertEqual(_Both().collect(), '/root/right/left/both')
+
+    def test_reduce_cooperate_can_not_mix(self):
+        _Both = self._make_reduce_hierarchy(
+            cooper.extend_cooperate, lambda name: [name])
+        def make_summed():
+            @self.cls_decorator.im_func
+            class _Summed(_Both):
+                __metaclass__ = self.cls_meta
+                @cooper.sum_cooperate
+                def collect(self):
+                    return 1
+        def make_mixed():
+            @self.cls_decorator.im_func
+            class _Mixed(_Both):
+                __metaclass__ = self.cls_meta
+                @cooper.cooperate
+                def collect(self):
+                    return []
+        self.assertClassFails(cooper.CooperativeError, make_summed)
+        self.assertClassFails(cooper.CooperativeError, make_mixed)
+
+    def _make_stream_hierarchy(self, decorator, log):
+        @self.cls_decorator.im_func
+        class _Root(object):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperative
+            def fields(self, **k):
+                log.append('root')
+                yield 'root'
+        @self.cls_decorator.im_func
+        class _Left(_Root):
+            __metaclass__ = self.cls_meta
+            @decorator
+            def fields(self, prefix=''):
+                log.append('left')
+                yield prefix + 'left'
+                yield prefix + 'left2'
+        @self.cls_decorator.im_func
+        class _Right(_Root):
+            __metaclass__ = self.cls_meta
+            @decorator
+            def fields(self):
+                log.append('right')
+                return iter(['right'])
+        return _Left, _Right
+
+    def test_stream_cooperate(self):
+        log = []
+        _Left, _Right = self._make_stream_hierarchy(
+            cooper.stream_cooperate, log)
+        @self.cls_decorator.im_func
+        class _Both(_Left, _Right):
+            __metaclass__ = self.cls_meta
+            @cooper.stream_cooperate
+            def fields(self):
+                yield 'both'
+        stream = _Both().fields(prefix='-')
+        self.assertEqual(log, [])
+        self.assertEqual(next(stream), 'root')
+        self.assertEqual(log, ['root'])
+        self.assertEqual(list(stream), ['right', '-left', '-left2', 'both'])
+        self.assertEqual(
+            [list(s) for s in cooper.call_all([_Both(), _Left()], 'fields')],
+            [['root', 'right', 'left', 'left2', 'both'],
+             ['root', 'left', 'left2']])
+
+    def test_post_stream_cooperate(self):
+        log = []
+        _Left, _Right = self._make_stream_hierarchy(
+            cooper.post_stream_cooperate, log)
+        @self.cls_decorator.im_func
+        class _Both(_Left, _Right):
+            __metaclass__ = self.cls_meta
+            @cooper.stream_cooperate
+            def fields(self):
+                yield 'both'
+        self.assertEqual(list(_Both().fields()),
+                         ['left', 'left2', 'right', 'root', 'both'])
+
+    def test_inner_stream_cooperate(self):
+        _Left, _Right = self._make_stream_hierarchy(
+            cooper.stream_cooperate, [])
+        @self.cls_decorator.im_func
+        class _Both(_Left, _Right):
+            __metaclass__ = self.cls_meta
+            @cooper.inner_stream_cooperate
+            def fields(self, next_method):
+                yield '('
+                for item in next_method(prefix='+'):
+                    yield item
+                yield ')'
+        self.assertEqual(list(_Both().fields()),
+                         ['(', 'root', 'right', '+left', '+left2', ')'])
+
+    @checked
+    def test_inner_stream_must_call_next(self):
+        _Left, _Right = self._make_stream_hierarchy(
+            cooper.stream_cooperate, [])
+        @self.cls_decorator.im_func
+        class _Both(_Left, _Right):
+            __metaclass__ = self.cls_meta
+            @cooper.inner_stream_cooperate
+            def fields(self, next_method):
+                yield 'both'
+        stream = _Both().fields()
+        self.assertEqual(next(stream), 'both')
+        self.assertRaises(cooper.CooperativeError, next, stream)
+
+    def test_stream_cooperate_can_not_mix(self):
+        _Left, _Right = self._make_stream_hierarchy(
+            cooper.stream_cooperate, [])
+        def make_cls():
+            @self.cls_decorator.im_func
+            class _Mixed(_Left):
+                __metaclass__ = self.cls_meta
+                @cooper.cooperate
+                def fields(self):
+                    return []
+        self.assertClassFails(cooper.CooperativeError, make_cls)
+
+    def _make_keyword_hierarchy(self):
+        @self.cls_decorator.im_func
+        class _Entity(object):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperative
+            def update(self, dt, **k):
+                return ('entity', dt, sorted(k.items()))
+        @self.cls_decorator.im_func
+        class _Moving(_Entity):
+            __metaclass__ = self.cls_meta
+            @cooper.post_cooperate
+            def update(self, dt, speed=1):
+                self.moved = dt * speed
+        @self.cls_decorator.im_func
+        class _Named(_Entity):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperate
+            def update(self, dt, name='anon'):
+                return name
+        @self.cls_decorator.im_func
+        class _Player(_Named, _Moving):
+            __metaclass__ = self.cls_meta
+            @cooper.inner_cooperate
+            def update(self, next_method, dt, score=0):
+                next_method()
+                return score
+        return _Entity, _Moving, _Named, _Player
+
+    def test_call_all_matches_single_calls(self):
+        objs = [self._F(), self._D(), self._A(), self._F(), self._B()]
+        self._clear_trace()
+        for obj in objs:
+            obj.method(1)
+        expected = self._trace[:]
+        self._clear_trace()
+        self.assertEqual(cooper.call_all(objs, 'method', 1), [None] * 5)
+        self.assertEqual(sorted(expected), sorted(self._trace))
+        self.assertTrue(all(obj._a_mparam == 1 for obj in objs))
+
+    def test_call_all_routes_keywords(self):
+        _Entity, _Moving, _Named, _Player = self._make_keyword_hierarchy()
+        objs = [_Player(), _Entity(), _Moving(), _Named(), _Player()]
+        results = cooper.call_all(objs, 'update', 2,
+                                  speed=3, name='x', score=5, extra=1)
+        self.assertEqual(results, [
+            5,
+            ('entity', 2, [('extra', 1), ('name', 'x'),
+                           ('score', 5), ('speed', 3)]),
+            ('entity', 2, [('extra', 1), ('name', 'x'), ('score', 5)]),
+            'x', 5])
+        self.assertEqual([getattr(obj, 'moved', None) for obj in objs],
+                         [6, None, 6, None, 6])
+        self.assertEqual(cooper.call_all([], 'update', 2), [])
+        self.assertRaises(AttributeError, cooper.call_all,
+                          [_Entity(), object()], 'update', 2)
+
+    def test_call_all_chunked(self):
+        _Entity, _Moving, _Named, _Player = self._make_keyword_hierarchy()
+        objs = [cls() for cls in (_Player, _Entity, _Moving, _Named) * 5]
+        expected = [obj.update(1, name='y') for obj in objs]
+        for executor in (cooper.SerialExecutor(),
+                         cooper.ThreadPoolExecutor(2)):
+            self.assertEqual(cooper.call_all_chunked(
+                executor, 2, objs, 'update', 1, name='y'), expected)
+        self.assertRaises(ValueError, cooper.call_all_chunked,
+                          cooper.SerialExecutor(), 0, objs, 'update', 1)
+        self.assertRaises(TypeError, cooper.call_all_chunked,
+                          cooper.SerialExecutor(), 3, objs, 'update')
+
+    def test_profiling_counts_every_override(self):
+        obj = self._D()
+        with cooper.profiling() as profile:
+            self._clear_trace()
+            obj.method(1)
+            self._check_trace_calls_with_mro(self._D.method)
+            obj.post_method(1)
+        stats = profile.as_dict()
+        for cls in (self._A, self._B, self._C, self._D):
+            self.assertEqual(stats[(cls, 'method')]['calls'], 1)
+            self.assertEqual(stats[(cls, 'post_method')]['calls'], 1)
+        chain = [stats[(cls, 'method')] for cls in self._D.__mro__[:-1]]
+        for outer, inner in zip(chain, chain[1:]):
+            self.assertTrue(outer['inclusive'] >= inner['inclusive'])
+        for stat in chain:
+            self.assertTrue(stat['exclusive'] <= stat['inclusive'])
+        self.assertTrue('_D.method' in profile.table())
+        obj.method(1)
+        self.assertEqual(profile.as_dict(), stats)
+
+    def test_profiling_restores_plain_runners(self):
+        obj = self._D()
+        obj.method(1)
+        step = self._D.__dict__['method']._cooperative_step
+        runners = cooper.class_runners(self._D)
+        runner = runners[step][1]
+        with cooper.profiling():
+            obj.method(1)
+            self.assertFalse(runners[step][1] is runner)
+        self.assertEqual(runners, {})
+        obj.method(1)
+        self.assertEqual(runners[step][1].__name__, runner.__name__)
+
+    def test_profiling_inner_and_batch_calls(self):
+        _Entity, _Moving, _Named, _Player = self._make_keyword_hierarchy()
+        objs = [_Player(), _Player(), _Moving()]
+        expected = [obj.update(2, name='x', score=1) for obj in objs]
+        with cooper.profiling() as profile:
+            self.assertEqual(cooper.call_all(objs, 'update', 2,
+                                             name='x', score=1), expected)
+        stats = profile.as_dict()
+        self.assertEqual(stats[(_Player, 'update')]['calls'], 2)
+        self.assertEqual(stats[(_Moving, 'update')]['calls'], 3)
+        self.assertEqual(stats[(_Entity, 'update')]['calls'], 3)
+        self.assertTrue(stats[(_Player, 'update')]['inclusive'] >=
+                        stats[(_Named, 'update')]['inclusive'])
+
+    def test_tracing_records_every_hop(self):
+        obj = self._D()
+        with cooper.tracing() as trace:
+            obj.method(1, b_mparam=2)
+        events = trace.events()
+        names = [cls.__name__ + '.method' for cls in self._D.__mro__[:-1]]
+        self.assertEqual([(e['ph'], e['name']) for e in events],
+                         [('B', name) for name in names] +
+                         [('E', name) for name in reversed(names)])
+        self.assertEqual(events[1]['args'], { 'keywords': ['b_mparam'] })
+        self.assertFalse('args' in events[0])
+        self.assertEqual(sorted(e['ts'] for e in events),
+                         [e['ts'] for e in events])
+
+    def test_tracing_inner_bodies_nest(self):
+        _Entity, _Moving, _Named, _Player = self._make_keyword_hierarchy()
+        with cooper.tracing() as trace:
+            _Player().update(1, score=2)
+        self.assertEqual([(e['ph'], e['name']) for e in trace.events()],
+                         [('B', '_Player.update'),
+                          ('B', '_Named.update'),
+                          ('B', '_Moving.update'),
+                          ('B', '_Entity.update'),
+                          ('E', '_Entity.update'),
+                          ('E', '_Moving.update'),
+                          ('E', '_Named.update'),
+                          ('E', '_Player.update')])
+
+    def test_tracing_buffer_is_bounded(self):
+        import json
+        from StringIO import StringIO
+        obj = self._D()
+        with cooper.tracing(capacity=5) as trace:
+            for _ in range(10):
+                obj.method(1)
+        events = trace.events()
+        self.assertEqual(len(trace.buffer), 5)
+        self.assertEqual([(e['ph'], e['name']) for e in events],
+                         [('B', '_A.method'), ('E', '_A.method')])
+        out = StringIO()
+        trace.dump(out)
+        self.assertEqual(json.loads(out.getvalue())['traceEvents'], events)
+
+    def _make_slotted_hierarchy(self):
+        @self.cls_decorator.im_func
+        class _Position(object):
+            __metaclass__ = self.cls_meta
+            __slots__ = ()
+            __cooperative_slots__ = ('x', 'y')
+            @cooper.cooperate
+            def __init__(self, x=0, y=0):
+                self.x, self.y = x, y
+        @self.cls_decorator.im_func
+        class _Velocity(object):
+            __metaclass__ = self.cls_meta
+            __slots__ = ()
+            __cooperative_slots__ = ('dx', 'x')
+            @cooper.cooperate
+            def __init__(self, dx=0):
+                self.dx = dx
+        @self.cls_decorator.im_func
+        class _Body(_Position, _Velocity):
+            __metaclass__ = self.cls_meta
+            __slots__ = ()
+            __cooperative_slots__ = 'mass'
+            @cooper.cooperate
+            def __init__(self, mass=1):
+                self.mass = mass
+        return _Position, _Velocity, _Body
+
+    def test_cooperative_slots_are_merged(self):
+        _Position, _Velocity, _Body = self._make_slotted_hierarchy()
+        self.assertEqual(cooper.cooperative_slots(_Body),
+                         ('dx', 'x', 'y', 'mass'))
+        obj = _Body(x=1, dx=2, mass=3)
+        self.assertEqual((obj.x, obj.y, obj.dx, obj.mass), (1, 0, 2, 3))
+        self.assertTrue(isinstance(obj, _Body))
+        self.assertEqual(type(obj).__name__, '_Body')
+        self.assertFalse(hasattr(obj, '__dict__'))
+        self.assertRaises(AttributeError, setattr, obj, 'z', 1)
+        import weakref
+        self.assertTrue(weakref.ref(obj)() is obj)
+        self.assertTrue(type(_Body()) is type(obj))
+        self.assertTrue(type(_Position()) is not type(obj))
+        self.assertEqual([o.mass for o in cooper.create_many(
+            _Body, columns={ 'mass': [4, 5] })], [4, 5])
+
+    def test_cooperative_slots_with_dict(self):
+        _Position, _Velocity, _Body = self._make_slotted_hierarchy()
+        @self.cls_decorator.im_func
+        class _Free(_Body):
+            __metaclass__ = self.cls_meta
+        obj = _Free(x=1)
+        obj.z = 2
+        self.assertEqual((obj.x, obj.z), (1, 2))
+
+    def _make_manifest_class(self, version=0, finalize=True):
+        @self.cls_decorator.im_func
+        class _Listed(self._D):
+            __metaclass__ = self.cls_meta
+            if version == 0:
+                @cooper.cooperate
+                def __init__(self, l_param=None):
+                    pass
+            elif version == 1:
+                @cooper.cooperate
+                def __init__(self, l_param=None):
+                    self._l_param = l_param
+            else:
+                @cooper.cooperate
+                def __init__(self, l_param=None, m_param=None):
+                    self._l_param = l_param
+        if finalize:
+            cooper.finalize_class(_Listed)
+        return _Listed
+
+    def test_class_hash_follows_code(self):
+        old_manifest = cooper.cooper.validation_manifest
+        cooper.finalize_class(self._D)
+        cooper.set_validation_manifest({})
+        try:
+            digest = self._make_manifest_class()._cooperative_hash
+            self.assertEqual(self._make_manifest_class()._cooperative_hash,
+                             digest)
+            # Only what the checks look at matters
+            self.assertEqual(self._make_manifest_class(1)._cooperative_hash,
+                             digest)
+            self.assertNotEqual(
+                self._make_manifest_class(2)._cooperative_hash, digest)
+        finally:
+            cooper.set_validation_manifest(old_manifest)
+
+    def test_class_hash_follows_decorator_options(self):
+        def make_cls(decorator):
+            class _Hashed(object):
+                @decorator
+                def collect(self):
+                    return []
+            return cooper.cooper.class_hash(_Hashed)
+        decorators = [
+            cooper.extend_cooperate,
+            cooper.sum_cooperate,
+            cooper.cached_cooperate(cooper.extend_cooperate),
+            cooper.cached_cooperate(cooper.extend_cooperate, maxsize=2),
+            cooper.cached_cooperate(cooper.sum_cooperate),
+            cooper.cooperate_with_params(a=1),
+            cooper.cooperate_with_params(b=1),
+            cooper.post_cooperate_with_params(a=1) ]
+        digests = map(make_cls, decorators)
+        self.assertEqual(len(set(digests)), len(decorators))
+        self.assertEqual(make_cls(cooper.reduce_cooperate(list.__add__, list)),
+                         make_cls(cooper.reduce_cooperate(list.__add__, list)))
+
+    def test_manifest_skips_checks(self):
+        old_manifest = cooper.cooper.validation_manifest
+        old_check    = cooper.cooper.check_all_params_are_keyword
+        checked      = []
+        def check(method):
+            checked.append(method)
+        cooper.finalize_class(self._D)
+        cooper.set_validation_manifest({})
+        cooper.cooper.check_all_params_are_keyword = check
+        try:
+            cls = self._make_manifest_class()
+            cooper.set_validation_manifest({ __name__: {
+                '_Listed': frozenset([cls._cooperative_hash]) } })
+            del checked[:]
+            cls = self._make_manifest_class(finalize=False)
+            self.assertTrue(cooper.is_validated(cls))
+            self.assertTrue(cooper.pending_finalization(cls))
+            self.assertEqual(cls(l_param=1)._b_param, 'b_param')
+            self.assertFalse(cooper.pending_finalization(cls))
+            self.assertEqual(checked, [])
+            cls = self._make_manifest_class(2)
+            self.assertFalse(cooper.is_validated(cls))
+            self.assertEqual(len(checked), 0 if cooper.get_release_mode()
+                             else 1)
+            self.assertEqual(cls(l_param=1)._l_param, 1)
+        finally:
+            cooper.set_validation_manifest(old_manifest)
+            cooper.cooper.check_all_params_are_keyword = old_check
+
+    def test_cooperative_state_is_ordered_by_mro(self):
+        _Position, _Velocity, _Body = self._make_slotted_hierarchy()
+        self.assertEqual(cooper.cooperative_state(_Body),
+                         ('dx', 'x', 'y', 'mass'))
+        obj = _Body(x=1, y=2, dx=3, mass=4)
+        self.assertEqual(obj.__getstate__(), (3, 1, 2, 4))
+
+    def test_state_copy_skips_init(self):
+        import copy
+        outer_self = self
+        _Position, _Velocity, _Body = self._make_slotted_hierarchy()
+        @self.cls_decorator.im_func
+        class _Traced(_Body):
+            __metaclass__ = self.cls_meta
+            __slots__ = ()
+            @cooper.cooperate
+            def __init__(self):
+                outer_self._trace.append(_Traced.__init__)
+        obj = _Traced(x=[1], mass=(2, 3))
+        obj.y = obj
+        self._clear_trace()
+        shallow = copy.copy(obj)
+        deep    = copy.deepcopy(obj)
+        self.assertEqual(self._trace, [])
+        self.assertTrue(type(shallow) is type(obj))
+        self.assertTrue(shallow.x is obj.x and shallow.y is obj)
+        self.assertEqual(deep.x, [1])
+        self.assertTrue(deep.x is not obj.x and deep.y is deep)
+        self.assertEqual(deep.mass, (2, 3))
+
+    def test_state_keeps_other_attributes(self):
+        import copy
+        _Position, _Velocity, _Body = self._make_slotted_hierarchy()
+        @self.cls_decorator.im_func
+        class _Free(_Body):
+            __metaclass__ = self.cls_meta
+            __cooperative_state__ = 'name',
+        obj = _Free()
+        del obj.dx
+        obj.name  = 'free'
+        obj.other = 1
+        self.assertEqual(obj.__getstate__(),
+                         (cooper.cooper._Unset, 0, 0, 1, 'free',
+                          { 'other': 1 }))
+        new = copy.copy(obj)
+        self.assertFalse(hasattr(new, 'dx'))
+        self.assertEqual((new.name, new.other, new.mass), ('free', 1, 1))
+        obj = _Free()
+        obj.name = 'x'
+        self.assertEqual(copy.copy(obj).__getstate__()[-1], None)
+        self.assertRaises(cooper.CooperativeError, new.__setstate__, (1, 2))
+
+    def test_state_respects_own_protocol(self):
+        @self.cls_decorator.im_func
+        class _Own(self._D):
+            __metaclass__ = self.cls_meta
+            __cooperative_state__ = 'value',
+            def __getstate__(self):
+                return 'own'
+        self.assertEqual(_Own().__getstate__(), 'own')
+        self.assertFalse(hasattr(_Own, '__copy__'))
+
+    def _make_finalized_hierarchy(self, log, init=cooper.cooperate):
+        @self.cls_decorator.im_func
+        class _Resource(self._D):
+            __metaclass__ = self.cls_meta
+            @init
+            def __init__(self):
+                cooper.add_finalizer(_Resource, self, log.append, 'resource')
+        @self.cls_decorator.im_func
+        class _Handle(_Resource):
+            __metaclass__ = self.cls_meta
+            @init
+            def __init__(self, name=None):
+                cooper.add_finalizer(_Handle, self, log.append, name)
+        return _Handle
+
+    def test_finalizers_run_on_collection_in_post_order(self):
+        import gc
+        log = []
+        _Handle = self._make_finalized_hierarchy(log)
+        obj = _Handle(name='handle')
+        obj.cycle = obj
+        self.assertTrue(cooper.has_finalizers(obj))
+        del obj
+        self.assertEqual(log, [])
+        gc.collect()
+        self.assertEqual(log, ['handle', 'resource'])
+        self.assertEqual(gc.garbage, [])
+
+    def test_finalizers_order_does_not_depend_on_constructors(self):
+        log = []
+        obj = self._make_finalized_hierarchy(
+            log, cooper.post_cooperate)(name='handle')
+        cooper.close(obj)
+        self.assertEqual(log, ['handle', 'resource'])
+
+    def test_finalizer_needs_weakref_and_base(self):
+        class _Slotted(object):
+            __slots__ = ()
+        self.assertRaises(cooper.CooperativeError, cooper.add_finalizer,
+                          _Slotted, _Slotted(), len, ())
+        self.assertRaises(cooper.CooperativeError, cooper.add_finalizer,
+                          _Slotted, self._D(), len, ())
+
+    def test_close_runs_finalizers_once(self):
+        log = []
+        obj = self._make_finalized_hierarchy(log)(name='handle')
+        self.assertTrue(cooper.close(obj))
+        self.assertEqual(log, ['handle', 'resource'])
+        self.assertFalse(cooper.has_finalizers(obj))
+        self.assertFalse(cooper.close(obj))
+        del obj
+        self.assertEqual(log, ['handle', 'resource'])
+        self.assertFalse(cooper.close(self._D()))
+
+    def test_close_runs_all_finalizers_on_error(self):
+        log = []
+        obj = self._make_finalized_hierarchy(log)(name='handle')
+        cooper.add_finalizer(type(obj), obj, log.pop, 5)
+        self.assertRaises(IndexError, cooper.close, obj)
+        self.assertEqual(log, ['handle', 'resource'])
+
+    def test_finalizers_with_cooperative_slots(self):
+        log = []
+        _Position, _Velocity, _Body = self._make_slotted_hierarchy()
+        obj = _Body()
+        cooper.add_finalizer(_Body, obj, log.append, 'body')
+        del obj
+        self.assertEqual(log, ['body'])
+
+    @checked
+    def test_finalizer_can_not_refer_to_object(self):
+        obj = self._D()
+        self.assertRaises(cooper.CooperativeError,
+                          cooper.add_finalizer, self._D, obj, obj.method, 1)
+        self.assertRaises(cooper.CooperativeError,
+                          cooper.add_finalizer, self._D, obj, repr, obj)
+        self.assertRaises(cooper.CooperativeError,
+                          cooper.add_finalizer, self._D, obj, dict, x=obj)
+
+    def test_create_many_from_rows(self):
+        rows = [{}, { 'b_param': 1 }, { 'd_param': 2, 'b_param': 3 },
+                { 'b_param': 4 }]
+        objs = cooper.create_many(self._D, iter(rows))
+        self.assertFalse(isinstance(objs, list))
+        self._clear_trace()
+        obj = next(objs)
+        self._check_trace_calls_with_mro(self._D.__init__)
+        objs = [obj] + list(objs)
+        self.assertEqual([(obj._b_param, obj._d_param) for obj in objs],
+                         [('b_param', 'd_param'), (1, 'd_param'),
+                          (3, 2), (4, 'd_param')])
+        self.assertTrue(all(type(obj) is self._D for obj in objs))
+
+    def test_create_many_from_columns(self):
+        objs = list(cooper.create_many(
+            self._F, columns={ 'b_param': [1, 2], 'd_param': 'xy' }))
+        self.assertEqual([(obj._b_param, obj._d_param) for obj in objs],
+                         [(1, 'x'), (2, 'y')])
+        self.assertRaises(ValueError, list, cooper.create_many(
+            self._F, columns={ 'b_param': [1, 2], 'd_param': 'x' }))
+
+    def test_create_many_checks_keywords_once(self):
+        objs = cooper.create_many(self._D, columns={ 'bad_param': [1] })
+        self.assertRaises(cooper.CooperativeError, list, objs)
+        objs = cooper.create_many(self._D, [{ 'b_param': 1 },
+                                            { 'bad_param': 1 }])
+        self.assertEqual(next(objs)._b_param, 1)
+        self.assertRaises(cooper.CooperativeError, next, objs)
+        self.assertRaises(TypeError, list, cooper.create_many(self._D))
+
+    def test_create_many_with_post_init(self):
+        outer_self = self
+        @self.cls_decorator.im_func
+        class _Post(self._D):
+            __metaclass__ = self.cls_meta
+            @cooper.post_cooperate
+            def __init__(self, p_param=None):
+                self._p_param = p_param
+                outer_self._trace.append(_Post.__init__)
+        _Post(p_param=0)
+        expected = self._trace[:]
+        self._clear_trace()
+        obj, = cooper.create_many(_Post, [{ 'p_param': 1, 'd_param': 2 }])
+        self.assertEqual(self._trace, expected)
+        self.assertEqual((obj._p_param, obj._d_param), (1, 2))
+
+    def test_dispatch_plan_follows_mro(self):
+        plan = cooper.dispatch_plan(self._F, 'method')
+        self.assertEqual([s.owner for s in plan.steps],
+                         [self._D, self._B, self._C])
+        self.assertEqual([s.kind for s in plan.steps],
+                         [cooper.PRE_COOPERATE] * 3)
+        self.assertEqual(plan.terminal[0], self._A)
+        plan = cooper.dispatch_plan(self._D, '__init__')
+        self.assertEqual([s.owner for s in plan.steps],
+                         [self._D, self._B, self._C, self._A])
+        self.assertEqual(plan.terminal[0], object)
+
+    def test_dispatch_plan_is_cached_per_concrete_class(self):
+        cooper.finalize_class(self._F)
+        step = self._D.__dict__['method']._cooperative_step
+        self._D().method(1)
+        self._F().method(1)
+        d_owner, runner = cooper.class_runners(self._D)[step]
+        f_owner, f_runner = cooper.class_runners(self._F)[step]
+        self.assertEqual((d_owner, f_owner), (self._D, self._F))
+        self.assertFalse(runner is f_runner)
+        self._D().method(1)
+        self.assertTrue(cooper.class_runners(self._D)[step][1] is runner)
+
+    def test_called_classes_can_be_collected(self):
+        import gc
+        import weakref
+        @self.cls_decorator.im_func
+        class _Dynamic(self._D):
+            __metaclass__ = self.cls_meta
+        _Dynamic().method(1)
+        cooper.call_all([_Dynamic(), _Dynamic()], 'method', 1)
+        ref = weakref.ref(_Dynamic)
+        del _Dynamic
+        gc.collect()
+        self.assertTrue(ref() is None)
+
+    def test_dispatch_plan_from_manual_subclass(self):
+        outer_self = self
+        @self.cls_decorator.im_func
+        class _Manual(self._D):
+            __metaclass__ = self.cls_meta
+            @cooper.manual_cooperate
+            def method(self, mparam):
+                super(_Manual, self).method(mparam)
+                outer_self._trace.append(_Manual.method)
+        obj = _Manual()
+        self._clear_trace()
+        obj.method(1)
+        self._check_trace_calls_with_mro(_Manual.method)
+        plan = cooper.dispatch_plan(_Manual, 'method')
+        self.assertEqual(plan.steps, ())
+        self.assertEqual(plan.terminal[0], _Manual)
+
     def _clear_trace(self):
         self._trace[:] = []
 
@@ -393,6 +1802,348 @@ class TestCoopMeta(TestCoop):
         _NewClass()
         self._check_trace_calls_with_mro(_NewClass.__init__)
 
+    def test_meta_create_many(self):
+        class _NewClass(cooper.Cooperative):
+            pass
+        objs = list(_NewClass.create_many([{}, {}]))
+        self.assertEqual([type(obj) for obj in objs], [_NewClass] * 2)
+
+    def test_meta_adds_empty_slots(self):
+        class _Left(cooper.SlottedCooperative):
+            __cooperative_slots__ = ('a',)
+        class _Right(cooper.SlottedCooperative):
+            __cooperative_slots__ = ('b',)
+        class _Both(_Left, _Right):
+            __cooperative_slots__ = ()
+        self.assertEqual(_Left.__slots__, ())
+        obj = _Both()
+        obj.a, obj.b = 1, 2
+        self.assertFalse(hasattr(obj, '__dict__'))
+
+    def test_plain_slots_keep_dict_and_weakref(self):
+        import weakref
+        class _Plain(cooper.Cooperative):
+            __slots__ = ('x',)
+        obj = _Plain()
+        obj.x = obj.y = 1
+        self.assertEqual(obj.__dict__, { 'y': 1 })
+        self.assertTrue(weakref.ref(obj)() is obj)
+
+class TestCoopClosureBackend(TestCoop):
+
+    def setUp(self):
+        self._old_backend = cooper.wrapper_backend
+        cooper.set_wrapper_backend(cooper.CLOSURE_BACKEND)
+        super(TestCoopClosureBackend, self).setUp()
+
+    def tearDown(self):
+        cooper.set_wrapper_backend(self._old_backend)
+
+    def test_unknown_backend_raises_error(self):
+        self.assertRaises(ValueError, cooper.set_wrapper_backend, 'magic')
+
+class TestCoopRelease(TestCoop):
+
+    def setUp(self):
+        self._old_release_mode = cooper.get_release_mode()
+        cooper.set_release_mode(True)
+        super(TestCoopRelease, self).setUp()
+
+    def tearDown(self):
+        cooper.set_release_mode(self._old_release_mode)
+
+    def test_release_skips_signature_checks(self):
+        @self.cls_decorator.im_func
+        class _Lax(object):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperate
+            def __init__(self, *a):
+                self.a = a
+        self.assertEqual(_Lax().a, ())
+
+    def test_release_does_not_check_next_method(self):
+        @self.cls_decorator.im_func
+        class _Cls(self._D):
+            __metaclass__ = self.cls_meta
+            @cooper.inner_cooperate
+            def method(self, next_method, mparam):
+                pass
+        cooper.set_release_mode(False)
+        obj = _Cls()
+        self._clear_trace()
+        obj.method(1)
+        self.assertEqual(self._trace, [])
+
+class TestCoopLazy(TestCoop):
+
+    def setUp(self):
+        self._old_lazy = cooper.lazy_finalization
+        cooper.set_lazy_finalization(True)
+        super(TestCoopLazy, self).setUp()
+
+    def tearDown(self):
+        import gc
+        cooper.set_lazy_finalization(self._old_lazy)
+        # Classes of the test that failed to finalize are left pending
+        gc.collect()
+        cooper.finalize_all()
+
+    def assertClassFails(self, exc, make_cls):
+        # Errors show up on finalization, which happens on creation for
+        # classes that hide cooperative methods without the metaclass
+        try:
+            make_cls()
+        except exc:
+            return
+        self.assertRaises(exc, cooper.finalize_all)
+
+    def test_lazy_class_is_not_decorated_on_creation(self):
+        self.assertTrue(isinstance(self._D.__dict__['method'],
+                                   cooper.CoopDecorator))
+        self.assertTrue(cooper.pending_finalization(self._D))
+
+    def test_lazy_class_is_finalized_on_method_access(self):
+        self._D.method
+        for cls in (self._A, self._B, self._C, self._D):
+            self.assertFalse(cooper.pending_finalization(cls))
+            self.assertFalse(isinstance(cls.__dict__['method'],
+                                        cooper.CoopDecorator))
+        self.assertTrue(cooper.pending_finalization(self._F))
+
+    def test_lazy_create_many_does_not_call_class(self):
+        made = []
+        make_row_constructor = cooper.cooper.make_row_constructor
+        def counting(*a, **k):
+            made.append(a)
+            return make_row_constructor(*a, **k)
+        cooper.cooper.make_row_constructor = counting
+        try:
+            objs = list(cooper.create_many(self._D, [{ 'b_param': 1 }]))
+        finally:
+            cooper.cooper.make_row_constructor = make_row_constructor
+        self.assertEqual(len(made), 1)
+        self.assertEqual(objs[0]._b_param, 1)
+
+    @checked
+    def test_lazy_errors_are_raised_again(self):
+        @self.cls_decorator.im_func
+        class _Bad(self._D):
+            __metaclass__ = self.cls_meta
+            @cooper.cooperate
+            def __init__(self, positional):
+                pass
+        self.assertRaises(cooper.CooperativeError, _Bad, 1)
+        self.assertRaises(cooper.CooperativeError, _Bad, 1)
+        self.assertRaises(cooper.CooperativeError,
+                          cooper.finalize_class, _Bad)
+
+    def test_lazy_finalization_is_thread_safe(self):
+        import threading
+        errors = []
+        def instantiate():
+            try:
+                for cls in (self._F, self._D, self._C):
+                    cls().method(1)
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=instantiate)
+                   for _ in xrange(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+    @checked
+    def test_lazy_decorator_class_hiding_cooperative_fails(self):
+        @cooper.cooperative_class
+        class _Base(object):
+            @cooper.cooperative
+            def method(self):
+                pass
+        def make_pending():
+            @cooper.cooperative_class
+            class _Bad(_Base):
+                def method(self):
+                    pass
+        self.assertRaises(cooper.CooperativeError, make_pending)
+        cooper.finalize_class(_Base)
+        self.assertRaises(cooper.CooperativeError, make_pending)
+
+    def test_lazy_decorator_class_with_only_decorators_is_pending(self):
+        @cooper.cooperative_class
+        class _Base(object):
+            @cooper.cooperative
+            def method(self):
+                pass
+        @cooper.cooperative_class
+        class _Cls(_Base):
+            @cooper.cooperate
+            def method(self):
+                pass
+            def other(self):
+                pass
+        self.assertTrue(cooper.pending_finalization(_Cls))
+        _Cls().method()
+        self.assertFalse(cooper.pending_finalization(_Cls))
+
+class TestCoopLazyMeta(TestCoopLazy, TestCoopMeta):
+
+    def assertClassFails(self, exc, make_cls):
+        # Errors in class definitions show up on finalization
+        make_cls()
+        self.assertRaises(exc, cooper.finalize_all)
+
+    def test_lazy_errors_show_up_on_finalize_all(self):
+        class _Bad(self._D):
+            def method(self, mparam):
+                pass
+        unittest.TestCase.assertRaises(self, cooper.CooperativeError,
+                                       cooper.finalize_all)
+        self.assertFalse(cooper.pending_finalization(_Bad))
+
+    @checked
+    def test_lazy_class_is_finalized_on_instantiation(self):
+        class _Base(cooper.Cooperative):
+            @cooper.cooperative
+            def method(self):
+                pass
+        cooper.finalize_class(_Base)
+        class _Bad(_Base):
+            def method(self):
+                pass
+        self.assertRaises(cooper.CooperativeError, _Bad)
+
+_validated_module = """
+import cooper
+
+class Good(cooper.Cooperative):
+    @cooper.cooperate
+    def __init__(self, param=None):
+        self.param = param
+"""
+
+class TestValidate(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self._old_manifest = cooper.cooper.validation_manifest
+        self._old_release_mode = cooper.get_release_mode()
+        self._dir = tempfile.mkdtemp()
+        self._output = os.path.join(self._dir, 'manifest.json')
+        os.mkdir(os.path.join(self._dir, '_validated'))
+        for name, source in (('__init__', ''),
+                             ('good', _validated_module)):
+            with open(os.path.join(self._dir, '_validated',
+                                   name + '.py'), 'w') as f:
+                f.write(source)
+        sys.path.insert(0, self._dir)
+        # The tool reports to the console
+        from StringIO import StringIO
+        self._old_streams = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO(), StringIO()
+
+    def tearDown(self):
+        import shutil
+        sys.stdout, sys.stderr = self._old_streams
+        sys.path.remove(self._dir)
+        for name in list(sys.modules):
+            if name.startswith('_validated'):
+                del sys.modules[name]
+        shutil.rmtree(self._dir)
+        cooper.set_validation_manifest(self._old_manifest)
+        cooper.set_release_mode(self._old_release_mode)
+
+    def _write_module(self, name, source):
+        with open(os.path.join(self._dir, '_validated',
+                               name + '.py'), 'w') as f:
+            f.write(source)
+
+    def test_validate_writes_manifest(self):
+        from cooper import validate
+        self.assertEqual(validate.main(['-o', self._output, '_validated']),
+                         0)
+        self.assertTrue(sys.stdout.getvalue().startswith(
+            'Checked 1 cooperative classes'))
+        good = sys.modules['_validated.good'].Good
+        cooper.load_validation_manifest(self._output)
+        self.assertEqual(cooper.cooper.validation_manifest, {
+            '_validated.good': { 'Good': frozenset([good._cooperative_hash])
+                                 } })
+
+    def test_validate_fails_without_manifest(self):
+        from cooper import validate
+        self._write_module('bad', _validated_module.replace(
+            'param=None', 'param'))
+        self.assertEqual(validate.main(['-o', self._output, '_validated']),
+                         1)
+        self.assertFalse(os.path.exists(self._output))
+        self.assertTrue('CooperativeError' in sys.stderr.getvalue())
+
+
+class _StatePosition(cooper.Cooperative):
+    __cooperative_slots__ = 'x', 'y'
+    @cooper.cooperate
+    def __init__(self, x=0, y=0):
+        self.x, self.y = x, y
+
+class _StateEntity(_StatePosition):
+    __cooperative_state__ = 'name', 'parent'
+    @cooper.cooperate
+    def __init__(self, name=None, parent=None):
+        self.name, self.parent = name, parent
+
+class _StateOwn(_StateEntity):
+    def __getstate__(self):
+        return { 'name': self.name }
+    def __setstate__(self, state):
+        self.name, self.parent, self.x, self.y = state['name'], None, -1, -1
+
+class _StateReduced(_StateEntity):
+    def __reduce__(self):
+        return _StateReduced, (), None
+
+class _StatePlain(object):
+    pass
+
+class TestCoopState(unittest.TestCase):
+
+    def test_pickle_round_trips(self):
+        import pickle, cPickle
+        root = _StateEntity(name='root', x=1)
+        obj  = _StateEntity(name='child', parent=root, y=2)
+        root.parent = obj
+        for module in pickle, cPickle:
+            for protocol in xrange(3):
+                new = module.loads(module.dumps(obj, protocol))
+                self.assertTrue(type(new) is type(obj))
+                self.assertEqual((new.name, new.x, new.y), ('child', 0, 2))
+                self.assertEqual(new.parent.name, 'root')
+                self.assertTrue(new.parent.parent is new)
+
+    def test_subclasses_can_define_their_own_state(self):
+        import copy, cPickle
+        own = _StateOwn(name='own', x=1, y=2)
+        reduced = _StateReduced(name='reduced', x=1)
+        for dup in (copy.copy, copy.deepcopy,
+                    lambda obj: cPickle.loads(cPickle.dumps(obj, 2))):
+            new = dup(own)
+            self.assertTrue(type(new) is type(own))
+            self.assertEqual((new.name, new.x, new.y), ('own', -1, -1))
+            new = dup(reduced)
+            self.assertTrue(type(new) is type(reduced))
+            self.assertEqual((new.name, new.x), (None, 0))
+
+    def test_pickle_is_compact(self):
+        import cPickle
+        plain = [_StatePlain() for _ in xrange(100)]
+        coop  = [_StateEntity(x=1, y=2, name='a') for _ in xrange(100)]
+        for obj in plain:
+            obj.__dict__.update(x=1, y=2, name='a', parent=None)
+        self.assertTrue(len(cPickle.dumps(coop, 2)) * 4 <
+                        len(cPickle.dumps(plain, 2)) * 3)
+
+
 class _TestBase(object):
     def __init__(self, param=None,*a, **k):
         super(_TestBase, self).__init__(*a, **k)